@@ -13,22 +13,66 @@
 
 
 # Global Import
+from __future__ import annotations
 import warnings
 warnings.filterwarnings('ignore')
+import importlib
 
-# Data Processing Packages
-import numpy               as np
-import pandas              as pd
+
+class LazyModule:
+    '''Stands in for a module and imports it the first time one of its attributes is used.'''
+    def __init__(self, name:str):
+        self.__dict__['_lazy_name'] = name
+
+    def __getattr__(self, attr:str):
+        module = importlib.import_module(self._lazy_name)
+        # Later lookups find the module's attributes directly, without coming back here.
+        self.__dict__.update(vars(module))
+        return(getattr(module, attr))
+
+
+# Data Processing Packages (imported on first use)
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
 
 # API/Caching Packages
-import requests
+requests = LazyModule('requests')
+urllib3 = LazyModule('urllib3')
 import json
+import csv
 import sqlite3
+import os
+import time
+import threading
+import tracemalloc
+import gc
+import functools
+import inspect
+import hashlib
+from collections import OrderedDict
+import http.server
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed
+import multiprocessing
+import asyncio
+import platform
+import tempfile
+import shutil
+import contextlib
+import io
+import unicodedata
+import re
+import bisect
+import difflib
+from collections import defaultdict
 import secrets as secrets
+import subprocess
+import sys
 
-#Data Visualization Packages
-import plotly.graph_objs as go
-import plotly.express as px
+#Data Visualization Packages (imported on first use)
+go = LazyModule('plotly.graph_objs')
+px = LazyModule('plotly.express')
+pio = LazyModule('plotly.io')
 
 
 # ### Function Definition
@@ -36,6 +80,275 @@ import plotly.express as px
 # In[2]:
 
 
+class Metrics:
+    '''Collects timing spans, event counters and gauges, and exports them as JSON or Prometheus text.
+
+    Span durations go into fixed-bucket latency histograms (in ms). When disabled, span() returns a shared
+    no-op context manager and count() returns immediately, so instrumented code pays only an attribute check.
+
+    Parameters
+    ----------
+    enabled (optional): boolean
+        Whether to record anything. False by default.
+    '''
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, enabled:bool=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.gauges = {}
+        self.reset()
+
+    def reset(self):
+        '''Clears the recorded histograms and counters (registered gauges are kept).'''
+        with self.lock:
+            self.histograms = {}
+            self.counters = defaultdict(int)
+
+    def span(self, name:str):
+        '''Returns a context manager that records the time spent inside it under the given name.'''
+        if not self.enabled:
+            return(NULL_SPAN)
+        return(Span(self, name))
+
+    def observe(self, name:str, ms:float):
+        '''Records one duration, in ms, in the named histogram.'''
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {'buckets':[0] * (len(self.BUCKETS_MS) + 1), 'count':0, 'sum_ms':0.0}
+            histogram['buckets'][bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+            histogram['count'] += 1
+            histogram['sum_ms'] += ms
+
+    def count(self, name:str, n:int=1):
+        '''Adds n to the named counter.'''
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += n
+
+    def gauge(self, name:str, func):
+        '''Registers a function whose value is read at export time (e.g. a cache hit ratio).'''
+        self.gauges[name] = func
+
+    def _quantile(self, histogram:dict, q:float):
+        # Upper bound of the bucket holding the q-th observation.
+        rank, seen = q * histogram['count'], 0
+        for bound, n in zip(self.BUCKETS_MS + (float('inf'),), histogram['buckets']):
+            seen += n
+            if seen >= rank:
+                return(bound)
+
+    def snapshot(self):
+        '''Returns the recorded metrics as a dictionary.'''
+        with self.lock:
+            histograms = {name:dict(h, buckets=list(h['buckets'])) for name, h in self.histograms.items()}
+            counters = dict(self.counters)
+        for histogram in histograms.values():
+            histogram['mean_ms'] = histogram['sum_ms'] / histogram['count']
+            histogram['p50_ms'] = self._quantile(histogram, 0.5)
+            histogram['p99_ms'] = self._quantile(histogram, 0.99)
+        return({'spans':histograms, 'counters':counters, 'gauges':{name:func() for name, func in self.gauges.items()},
+                'buckets_ms':list(self.BUCKETS_MS)})
+
+    def to_json(self):
+        '''Returns the recorded metrics as a JSON string.'''
+        return(json.dumps(self.snapshot()))
+
+    def to_prometheus(self, prefix:str='pl'):
+        '''Returns the recorded metrics in the Prometheus text exposition format.'''
+        data = self.snapshot()
+        lines = [f'# TYPE {prefix}_span_ms histogram']
+        for name, histogram in data['spans'].items():
+            cumulative = 0
+            for bound, n in zip(self.BUCKETS_MS + ('+Inf',), histogram['buckets']):
+                cumulative += n
+                lines.append(f'{prefix}_span_ms_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_span_ms_sum{{span="{name}"}} {histogram["sum_ms"]}')
+            lines.append(f'{prefix}_span_ms_count{{span="{name}"}} {histogram["count"]}')
+        lines.append(f'# TYPE {prefix}_events_total counter')
+        for name, value in data['counters'].items():
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        for name, value in data['gauges'].items():
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {value}')
+        return('\n'.join(lines) + '\n')
+
+
+class Span:
+    '''Times a with-block and records the duration in a Metrics histogram (see Metrics.span).'''
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics:Metrics, name:str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return(False)
+
+NULL_SPAN = contextlib.nullcontext()
+
+
+# In[3]:
+
+
+# Seasons that can be charted, oldest first. Each has its own gameweek and player id files (player ids are
+# reassigned every season) and is loaded on first use; api_season is the season's year in the API statistics.
+SEASONS = {'2019-20':{'gameweek_path':'players_1920_fin.csv', 'names_path':'player_idlist.csv', 'api_season':2019}}
+CURRENT_SEASON = '2019-20'
+LEAGUE_ID = 39
+
+
+# In[4]:
+
+
+class ApiCache:
+    '''A SQLite-backed store of API responses, one row per player, with optional expiry and LRU eviction.
+
+    Every write is its own transaction, so a crash never leaves a half-written cache behind.
+    On first use, the entries of the old JSON cache file (if any) are copied in.
+
+    Reads do not write: the access times of hits are kept in memory and saved with the next write, or once
+    touch_batch of them have built up, so a read-mostly cache does not commit on every lookup.
+
+    Parameters
+    ----------
+    path (optional): string
+        Path to the SQLite cache file.
+
+    max_entries (optional): int
+        Maximum number of entries kept. The least recently used entries are evicted beyond this.
+
+    ttl (optional): float
+        Default lifetime of an entry in seconds. None means entries never expire.
+
+    legacy_path (optional): string
+        Path to a JSON cache file to migrate from.
+
+    touch_batch (optional): int
+        Number of unsaved access times after which they are written without waiting for a put.
+    '''
+    def __init__(self, path:str='api_cache.sqlite', max_entries:int=2000, ttl:float=None, legacy_path:str=None,
+                 touch_batch:int=256):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_batch = touch_batch
+        self.touched = {}
+        self.stats = {'hits':0, 'misses':0, 'expired':0, 'evictions':0}
+        self.version = 0
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] == 0:
+            with self.conn:
+                self.conn.execute('''
+                    CREATE TABLE IF NOT EXISTS "api_cache" (
+                        name TEXT PRIMARY KEY NOT NULL,
+                        payload TEXT NOT NULL,
+                        expires_at REAL,
+                        accessed_at REAL NOT NULL
+                );''')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS "api_cache_accessed" ON "api_cache" (accessed_at)')
+                self.conn.execute('PRAGMA user_version = 1')
+            if legacy_path and os.path.exists(legacy_path):
+                with open(legacy_path, 'r') as json_file:
+                    self.put_many(json.load(json_file))
+
+    def get(self, name:str):
+        '''Returns the cached API data for a player, or None if it is missing or has expired.'''
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute('SELECT payload, expires_at FROM api_cache WHERE name=?', [name]).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return(None)
+            if row[1] is not None and row[1] <= now:
+                with self.conn:
+                    self.conn.execute('DELETE FROM api_cache WHERE name=?', [name])
+                self.touched.pop(name, None)
+                self.version += 1
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return(None)
+            self.touched[name] = now
+            if len(self.touched) >= self.touch_batch:
+                with self.conn:
+                    self._save_touches()
+            self.stats['hits'] += 1
+        return(json.loads(row[0]))
+
+    def _save_touches(self):
+        # Writes the access times of the hits since the last write, inside the caller's transaction.
+        if self.touched:
+            self.conn.executemany('UPDATE api_cache SET accessed_at=? WHERE name=?',
+                                  [(accessed_at, name) for name, accessed_at in self.touched.items()])
+            self.touched = {}
+
+    def put(self, name:str, value:dict, ttl:float=None):
+        '''Stores the API data for a single player.'''
+        self.put_many({name:value}, ttl)
+
+    def put_many(self, entries:dict, ttl:float=None):
+        '''Stores the API data for several players in a single transaction.'''
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else now + ttl
+        with metrics.span('api_cache.json_dump'):
+            rows = [(name, json.dumps(value), expires_at, now) for name, value in entries.items()]
+        with self.lock, self.conn:
+            self.conn.executemany('''
+                INSERT INTO api_cache(name, payload, expires_at, accessed_at) VALUES (?,?,?,?)
+                ON CONFLICT(name) DO UPDATE SET payload=excluded.payload, expires_at=excluded.expires_at,
+                                                accessed_at=excluded.accessed_at
+            ''', rows)
+            for name in entries:
+                self.touched.pop(name, None)
+            self._save_touches()
+            self._evict()
+            self.version += 1
+
+    def _evict(self):
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self.conn.execute('''
+                DELETE FROM api_cache WHERE name IN (SELECT name FROM api_cache ORDER BY accessed_at LIMIT ?)
+            ''', [excess])
+            self.stats['evictions'] += excess
+
+    def items(self):
+        '''Returns every unexpired entry as a dictionary of player name to API data, without counting them as reads.'''
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT name, payload FROM api_cache WHERE expires_at IS NULL OR expires_at > ? ORDER BY name
+            ''', [time.time()]).fetchall()
+        return({name:json.loads(payload) for name, payload in rows})
+
+    def __contains__(self, name:str):
+        with self.lock:
+            row = self.conn.execute('SELECT expires_at FROM api_cache WHERE name=?', [name]).fetchone()
+        return(row is not None and (row[0] is None or row[0] > time.time()))
+
+    def __len__(self):
+        with self.lock:
+            return(self.conn.execute('SELECT COUNT(*) FROM api_cache').fetchone()[0])
+
+    def close(self):
+        '''Saves any pending access times and closes the cache's database connection.'''
+        with self.lock:
+            with self.conn:
+                self._save_touches()
+            self.conn.close()
+
+
+# In[5]:
+
+
 def get_player_api(name:str):
     '''Return a dictionary instance of a player's API data.
     
@@ -49,93 +362,672 @@ def get_player_api(name:str):
     dict
         Dictionary instance of a player's API data.
     '''
-    if name in curr_cache.keys():
+    context.require('names', 'api')
+    typed_name = name
+    player_id = name_index.resolve(name)
+    if player_id is not None:
+        name = name_index.names[player_id]
+
+    with metrics.span('api.cache_read'):
+        cached = api_cache.get(name)
+        # Entries migrated from the old JSON cache are keyed by the name as it was typed
+        if cached is None and typed_name != name:
+            cached = api_cache.get(typed_name)
+    if cached is not None:
+        metrics.count('api.cache_hit')
         print('Using cache\n')
-        api_result = curr_cache[name]
-        return(api_result)
+        return(cached)
 
     else:
+        metrics.count('api.cache_miss')
         print('Using API\n')
+        with metrics.span('api.network'):
+            api_result = fetch_player_api(name)
+        if api_result is not None:
+            with metrics.span('api.cache_write'):
+                api_cache.put(name, api_result)
+            
+        return(api_result)
+
+
+# In[6]:
+
+
+def fetch_player_api(name:str, client=None):
+    '''Fetches a player's API data from the /players endpoint, bypassing the cache.
+
+    Concurrent fetches of the same name share a single request.
+    
+    Parameters
+    ----------
+    name: string
+        Name of the player.
+
+    client (optional): ApiClient
+        The client to fetch with. Defaults to the shared api_client.
+    
+    Returns
+    -------
+    dict
+        Dictionary instance of a player's API data, or None if no player matched.
+    '''
+    context.require('names', 'api')
+    client = api_client if client is None else client
+    player_id = name_index.resolve(name)
+    if player_id is not None:
+        name, f_name, s_name = name_index.names[player_id], name_index.first[player_id], name_index.second[player_id]
+    else:
         f_name = name.split()[0]
         s_name = name.replace(f_name + " ","")
-        
-        url = "https://v3.football.api-sports.io/players"
+    wanted = {fold_name(f'{f_name[0]}. {s_name}'), fold_name(name)}
 
-        query={'league':39, 'search':s_name}
-        headers = {
-          'x-apisports-key': secrets.API_KEY,
-        }
+    def fetch():
+        response_text = client.get_json({'league':LEAGUE_ID, 'search':s_name})
 
-        response = requests.request("GET", url, headers=headers, params=query)
-        response_text = json.loads(response.text)
-        
         if response_text['results'] > 1:
             for player in response_text['response']:
-                if player['player']['name'] == f'{name[0]}. {s_name}' or player['player']['name'] == name:
-                    api_result = {name:player}
-                    
+                api_names = {fold_name(player['player']['name']),
+                             fold_name(f"{player['player']['firstname']} {player['player']['lastname']}")}
+                if wanted & api_names:
+                    return(player)
+            return(None)
+        elif response_text['results'] == 1:
+            return(response_text['response'][0])
         else:
-            api_result = {name:response_text['response'][0]}
-            
-        curr_cache.update(api_result)
-        
-        with open('api_cache.json', 'w') as json_file:
-            json.dump(curr_cache, json_file)
-            
-        return(api_result[name])
+            return(None)
 
+    return(client.single_flight(name, fetch))
+
+
+# In[7]:
+
+
+class ApiClient:
+    '''HTTP client for the /players endpoint with pooled keep-alive connections, timeouts and retries.
+
+    Requests that fail with a connection error, 429 or 5xx are retried with exponential backoff
+    (honouring Retry-After). single_flight() lets concurrent callers asking for the same thing share one request.
+
+    Parameters
+    ----------
+    url (optional): string
+        URL of the /players endpoint.
+
+    timeout (optional): tuple
+        Connect and read timeouts in seconds.
+
+    retries (optional): int
+        Maximum number of retries per request.
+
+    backoff_factor (optional): float
+        Base of the backoff between retries (backoff_factor * 2 ** (retry - 1) seconds).
+
+    pool_size (optional): int
+        Maximum number of connections kept open.
+
+    api_key (optional): string
+        API key sent with every request. Defaults to secrets.API_KEY.
+    '''
+    def __init__(self, url:str="https://v3.football.api-sports.io/players", timeout:tuple=(3.05, 10),
+                 retries:int=3, backoff_factor:float=0.5, pool_size:int=10, api_key:str=None):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+        retry = urllib3.util.Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET'], raise_on_status=False)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self, params:dict):
+        '''Sends a GET to the endpoint and returns the decoded JSON body, raising on an HTTP error.'''
+        headers = {
+          'x-apisports-key': secrets.API_KEY if self.api_key is None else self.api_key,
+        }
+        response = self.session.get(self.url, headers=headers, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return(response.json())
+
+    def single_flight(self, key:str, func):
+        '''Calls func, unless a call for the same key is already running, in which case its result is shared.'''
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+
+        if not owner:
+            return(future.result())
+
+        try:
+            future.set_result(func())
+        except Exception as error:
+            future.set_exception(error)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+        return(future.result())
+
+
+# In[8]:
+
+
+class RateLimiter:
+    '''Spaces out calls so that no more than a given number start in any minute, across all threads.
+
+    Parameters
+    ----------
+    requests_per_minute: float
+        The request budget per minute.
+    '''
+    def __init__(self, requests_per_minute:float):
+        self.interval = 60.0 / requests_per_minute
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        '''Blocks until the caller's turn in the budget comes up.'''
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# In[9]:
+
+
+def prefetch_players(names_path:str='player_idlist.csv', requests_per_minute:float=30, max_workers:int=4,
+                     batch_size:int=25, client=None):
+    '''Fetches the API data of every player in the id list that is not cached yet, concurrently.
+
+    Requests are spread over a thread pool, limited to a number in flight and a number per minute.
+    Results are written to the cache in batches, each in a single transaction.
+
+    Parameters
+    ----------
+    names_path (optional): string
+        Path to the player id/name CSV file.
+
+    requests_per_minute (optional): float
+        The request budget per minute.
+
+    max_workers (optional): int
+        Maximum number of requests in flight at once.
+
+    batch_size (optional): int
+        Number of fetched players written to the cache per transaction.
+
+    client (optional): ApiClient
+        The client to fetch with. Defaults to the shared api_client.
+
+    Returns
+    -------
+    dict
+        Counts of cached, fetched and unmatched players, the failures by player name, and the time taken.
+    '''
+    context.require('api')
+    start = time.perf_counter()
+    name_data = pd.read_csv(names_path)
+    names = [f_name + ' ' + s_name for f_name, s_name in zip(name_data['first_name'], name_data['second_name'])]
+    to_fetch = [name for name in names if name not in api_cache]
+
+    limiter = RateLimiter(requests_per_minute)
+    def fetch(name):
+        limiter.wait()
+        return(fetch_player_api(name, client))
+
+    summary = {'cached':len(names) - len(to_fetch), 'fetched':0, 'not_found':0, 'failed':{}}
+    batch = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch, name):name for name in to_fetch}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                player = future.result()
+            except Exception as error:
+                summary['failed'][name] = repr(error)
+                continue
+            if player is None:
+                summary['not_found'] += 1
+                continue
+            batch[name] = player
+            if len(batch) >= batch_size:
+                api_cache.put_many(batch)
+                summary['fetched'] += len(batch)
+                batch = {}
+    if batch:
+        api_cache.put_many(batch)
+        summary['fetched'] += len(batch)
+
+    summary['seconds'] = time.perf_counter() - start
+    return(summary)
 
-# In[3]:
+
+# In[10]:
 
 
-def at_a_glance(player_dict:dict):
-    '''Gives a snapshot look at a player's 2019/20 season statistics.
+def at_a_glance(player_dict:dict, season:str=None):
+    '''Gives a snapshot look at a player's statistics for one season.
     
     Parameters
     ----------
     player_dict: dict
         Dictonary instance of a player's API data.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
     
     Returns
     -------
     None
     '''
-    player_info = player_dict['player']
-    club_name = player_dict['statistics'][1]['team']['name']
-    season_stats = player_dict['statistics'][1]
+    season = CURRENT_SEASON if season is None else season
+    summary = glance_summary(player_dict, season)
 
-    print(f'Name: {player_info["firstname"]+ " " + player_info["lastname"]}\nAge: {player_info["age"]}\nPosition: {season_stats["games"]["position"]}\nCurrent Club: {club_name}\nNationality: {player_info["nationality"]}\n')
-    print('2019/20 Stats:\n\n')
-    print(f'Appearances: {season_stats["games"]["appearences"]}')
+    print('\n'.join(f'{k}: {v}' for k, v in summary['profile'].items()) + '\n')
+    print(f'{season.replace("-", "/")} Stats:\n\n')
+    stats = list(summary['stats'].items())
+    for k, v in stats[:-1]:
+        print(f'{k}: {v}')
+    print(f'{stats[-1][0]}: {stats[-1][1]}\n')
+
+
+# In[11]:
+
+
+def glance_summary(player_dict:dict, season:str=None):
+    '''Collects the profile and position-specific statistics for one season shown by at_a_glance.
+
+    The entry whose league season matches the season's api_season is used. Records without league details
+    fall back to the second entry, which is where the 2019/20 statistics have always been (or to the only one).
     
+    Parameters
+    ----------
+    player_dict: dict
+        Dictonary instance of a player's API data.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
     
-    if season_stats["games"]["position"]=="Attacker":
-        print(f'Goals Scored: {season_stats["goals"]["total"]}')
-        print(f'Assists: {season_stats["goals"]["assists"]}')
-        print(f'Shot Accuracy: {round(season_stats["shots"]["on"]*100/season_stats["shots"]["total"])}%')
-    elif season_stats["games"]["position"]=="Defender":
-        print(f'Goals Scored: {season_stats["goals"]["total"]}')
-        print(f'Tackles: {season_stats["tackles"]["total"]}')
-        print(f'Duel Success Rate: {round(season_stats["duels"]["won"]*100/season_stats["duels"]["total"])}%')
-        print(f'Fouls Committed: {season_stats["fouls"]["committed"]}')
-    elif season_stats["games"]["position"]=="Midfielder":
-        print(f'Goals Scored: {season_stats["goals"]["total"]}')
-        print(f'Assists: {season_stats["goals"]["assists"]}')
-        print(f'Shot Accuracy: {round(season_stats["shots"]["on"]*100/season_stats["shots"]["total"])}%')
-        print(f'Dribble Success Rate: {round(season_stats["dribbles"]["success"]*100/season_stats["dribbles"]["attempts"])}%')
-        print(f'Tackles: {season_stats["tackles"]["total"]}')
-    else: #Goalkeepers
-        print(f'Goals Conceded: {season_stats["goals"]["conceded"]}')
-        print(f'Saves: {season_stats["goals"]["saves"]}')
-    print(f'Passing Accuracy: {season_stats["passes"]["accuracy"]}%')
-    print(f'Cards: Yellow({season_stats["cards"]["yellow"]}) Red({season_stats["cards"]["yellowred"]+season_stats["cards"]["red"]})\n')
+    Returns
+    -------
+    dict
+        'profile' and 'stats' dictionaries of label to displayed value ('N/A' where the API has no value,
+        or a rate has nothing to divide by).
+    '''
+    api_season = SEASONS[CURRENT_SEASON if season is None else season]['api_season']
+    rows = flatten_api_record(player_dict['player']['name'], player_dict)
+    fallback = rows[1] if len(rows) > 1 else rows[0]
+    return(glance_row_summary(next((row for row in rows if row['league_season'] == api_season), fallback)))
 
 
-# In[4]:
+# In[12]:
+
+
+# Columns of the flattened API table taken from each statistics entry, by (group, field) in the entry.
+API_STAT_COLUMNS = {'team':('team', 'name'), 'league_id':('league', 'id'), 'league_season':('league', 'season'),
+                    'position':('games', 'position'), 'appearances':('games', 'appearences'),
+                    'goals':('goals', 'total'), 'assists':('goals', 'assists'), 'conceded':('goals', 'conceded'),
+                    'saves':('goals', 'saves'), 'shots_total':('shots', 'total'), 'shots_on':('shots', 'on'),
+                    'passes_accuracy':('passes', 'accuracy'), 'tackles':('tackles', 'total'),
+                    'duels_total':('duels', 'total'), 'duels_won':('duels', 'won'),
+                    'dribbles_attempts':('dribbles', 'attempts'), 'dribbles_success':('dribbles', 'success'),
+                    'fouls_committed':('fouls', 'committed'), 'yellow':('cards', 'yellow'),
+                    'yellowred':('cards', 'yellowred'), 'red':('cards', 'red')}
+API_PLAYER_COLUMNS = ['firstname', 'lastname', 'age', 'nationality']
+API_CATEGORY_COLUMNS = ('nationality', 'team', 'position')
+
+# Percentage rates derived from the table: numerator and denominator columns.
+GLANCE_RATIOS = {'shot_accuracy':('shots_on', 'shots_total'), 'duel_success':('duels_won', 'duels_total'),
+                 'dribble_success':('dribbles_success', 'dribbles_attempts')}
+
+# The statistics at_a_glance shows for each position (anything else is shown as a goalkeeper), then for everyone.
+GLANCE_STATS = {'Attacker':[('Goals Scored', 'goals'), ('Assists', 'assists'), ('Shot Accuracy', 'shot_accuracy')],
+                'Defender':[('Goals Scored', 'goals'), ('Tackles', 'tackles'), ('Duel Success Rate', 'duel_success'),
+                            ('Fouls Committed', 'fouls_committed')],
+                'Midfielder':[('Goals Scored', 'goals'), ('Assists', 'assists'), ('Shot Accuracy', 'shot_accuracy'),
+                              ('Dribble Success Rate', 'dribble_success'), ('Tackles', 'tackles')],
+                'Goalkeeper':[('Goals Conceded', 'conceded'), ('Saves', 'saves')]}
+GLANCE_COMMON = [('Passing Accuracy', 'passes_accuracy'), ('Yellow Cards', 'yellow'), ('Red Cards', 'red_cards')]
+GLANCE_PERCENT = ('shot_accuracy', 'duel_success', 'dribble_success', 'passes_accuracy')
+
+
+# In[13]:
+
+
+def api_int(value):
+    '''Reads an API count as an int, or None where it is missing or not a whole number.'''
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return(None)
+    return(int(number) if number.is_integer() else None)
+
+
+# In[14]:
+
+
+def flatten_api_record(name:str, player_dict:dict):
+    '''Flattens one player's API data into plain rows, one per entry in the player's statistics list.
+
+    Used directly where a single player is shown (see glance_summary), so that path does not import pandas.
+
+    Parameters
+    ----------
+    name: string
+        The player's name (e.g. the API cache key).
+
+    player_dict: dict
+        Dictonary instance of a player's API data.
+
+    Returns
+    -------
+    list
+        Dictionaries with the columns of flatten_api_records. Counts are ints, and counts and rates
+        are None where flatten_api_records has a missing value or NaN.
+    '''
+    player_info = player_dict['player']
+    rows = []
+    for entry, season_stats in enumerate(player_dict['statistics']):
+        row = {'name':name, 'player_id':api_int(player_info.get('id'))}
+        for column in API_PLAYER_COLUMNS:
+            value = player_info.get(column)
+            row[column] = value if column in API_CATEGORY_COLUMNS or column in ('firstname', 'lastname') else api_int(value)
+        row['entry'] = entry
+        for column, (group, field) in API_STAT_COLUMNS.items():
+            value = (season_stats.get(group) or {}).get(field)
+            row[column] = value if column in API_CATEGORY_COLUMNS else api_int(value)
+
+        for ratio, (numerator, denominator) in GLANCE_RATIOS.items():
+            num, den = row[numerator], row[denominator]
+            row[ratio] = num * 100 / den if num is not None and den is not None and den > 0 else None
+        row['red_cards'] = None if row['yellowred'] is None or row['red'] is None else row['yellowred'] + row['red']
+        rows.append(row)
+    return(rows)
+
+
+# In[15]:
+
+
+def flatten_api_records(records:dict):
+    '''Flattens players' API data into a typed table with one row per player, season and team.
+
+    Counts are nullable integers (missing where the API has null), text columns with few values are categorical,
+    and the GLANCE_RATIOS rates are computed for every row at once: they are NaN where the denominator is zero
+    or missing. red_cards counts second yellows and straight reds together.
+
+    Parameters
+    ----------
+    records: dict
+        Player name (e.g. the API cache key) to that player's API data.
+
+    Returns
+    -------
+    DataFrame
+        The name, the API player id, API_PLAYER_COLUMNS, the entry's position in the player's statistics list,
+        API_STAT_COLUMNS, the rates and red_cards.
+    '''
+    columns = ['name', 'player_id'] + API_PLAYER_COLUMNS + ['entry'] + list(API_STAT_COLUMNS) + list(GLANCE_RATIOS) + ['red_cards']
+    table = pd.DataFrame([row for name, player_dict in records.items() for row in flatten_api_record(name, player_dict)],
+                         columns=columns)
+    for column in table.columns:
+        if column in API_CATEGORY_COLUMNS:
+            table[column] = table[column].astype('category')
+        elif column in ('name', 'firstname', 'lastname'):
+            table[column] = table[column].astype('string')
+        elif column in GLANCE_RATIOS:
+            table[column] = table[column].astype(np.float64)
+        else:
+            table[column] = table[column].astype('Int64')
+    return(table)
+
+
+# In[16]:
+
+
+def season_api_rows(table:pd.DataFrame, season:str=None):
+    '''Picks each player's row for one season out of a flattened API table, as glance_summary does.
+
+    Parameters
+    ----------
+    table: DataFrame
+        A table from flatten_api_records.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    DataFrame
+        One row per player, in the table's order.
+    '''
+    api_season = SEASONS[CURRENT_SEASON if season is None else season]['api_season']
+    matched = table[table['league_season'].eq(api_season).fillna(False)].drop_duplicates('name')
+    fallback_entry = table.groupby('name', sort=False)['entry'].transform('max').clip(upper=1)
+    fallback = table[(table['entry'] == fallback_entry) & ~table['name'].isin(matched['name'])]
+    return(pd.concat([matched, fallback]).sort_index())
+
+
+# In[17]:
+
+
+def glance_value(value, percent:bool=False):
+    '''Formats one value of a flattened row for display: 'N/A' if missing, rates rounded to a whole percentage.'''
+    if value is None:
+        return('N/A')
+    if percent:
+        return(f'{round(value)}%')
+    return(value)
+
+
+# In[18]:
+
+
+def glance_row_summary(row:dict):
+    '''Builds at_a_glance's profile and position-specific statistics from one row of flatten_api_record.'''
+    profile = {'Name':f'{row["firstname"]} {row["lastname"]}', 'Age':glance_value(row['age']),
+               'Position':glance_value(row['position']), 'Current Club':glance_value(row['team']),
+               'Nationality':glance_value(row['nationality'])}
+    stats = {'Appearances':glance_value(row['appearances'])}
+    for label, column in GLANCE_STATS.get(row['position'], GLANCE_STATS['Goalkeeper']):
+        stats[label] = glance_value(row[column], column in GLANCE_PERCENT)
+    stats['Passing Accuracy'] = glance_value(row['passes_accuracy'], True)
+    stats['Cards'] = f'Yellow({glance_value(row["yellow"])}) Red({glance_value(row["red_cards"])})'
+    return({'profile':profile, 'stats':stats})
+
 
+# In[19]:
+
+
+def glance_table():
+    '''Returns every cached player's API data as one flattened table (see flatten_api_records).
+
+    The table is rebuilt only after the cache is written to.
+    '''
+    context.require('api')
+    cached = glance_tables.get(id(api_cache))
+    if cached is None or cached[0] != api_cache.version:
+        version = api_cache.version
+        with metrics.span('api.glance_table'):
+            cached = glance_tables[id(api_cache)] = (version, flatten_api_records(api_cache.items()))
+    return(cached[1])
+
+
+# In[20]:
+
+
+def glance_compare(names:list=None, season:str=None, position:str=None):
+    '''Compares the at_a_glance statistics of several players side by side, one row per player.
+
+    Parameters
+    ----------
+    names (optional): list
+        The players to compare, looked up with get_player_api. Defaults to every cached player.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    position (optional): string
+        Only keep players listed at this position (e.g. 'Midfielder'), and show just its statistics.
+
+    Returns
+    -------
+    DataFrame
+        Name, age, position, club and appearances, then the position statistics (rates in percent, NaN where
+        there was nothing to divide by) and passing accuracy and cards.
+    '''
+    if names is None:
+        table = glance_table()
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            records = {name:get_player_api(name) for name in names}
+        table = flatten_api_records({name:player_dict for name, player_dict in records.items() if player_dict is not None})
+
+    rows = season_api_rows(table, season)
+    if position is None:
+        stats = [stat for position_stats in GLANCE_STATS.values() for stat in position_stats]
+    else:
+        rows = rows[rows['position'] == position]
+        stats = GLANCE_STATS.get(position, GLANCE_STATS['Goalkeeper'])
+    stats = dict(stats + GLANCE_COMMON)
+
+    compared = pd.DataFrame({'Name':rows['firstname'] + ' ' + rows['lastname'], 'Age':rows['age'],
+                             'Position':rows['position'], 'Current Club':rows['team'],
+                             'Appearances':rows['appearances']})
+    for label, column in stats.items():
+        compared[label] = rows[column].round(1) if column in GLANCE_RATIOS else rows[column]
+    return(compared.reset_index(drop=True))
+
+
+# In[21]:
+
+
+class FigureCache:
+    '''A size-bounded LRU of finished chart figures, keyed by chart request.
+
+    Entries evicted from memory can be spilled to disk as figure JSON and reloaded on a later request.
+    Every lookup carries a token identifying the dataset; when it changes, all entries are dropped.
+
+    Parameters
+    ----------
+    max_entries (optional): int
+        Maximum number of figures kept in memory.
 
-def line_ind(player_name:str, metric:str):
+    spill_dir (optional): string
+        Directory evicted figures are written to. None disables spilling.
+    '''
+    def __init__(self, max_entries:int=64, spill_dir:str=None):
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self.entries = OrderedDict()
+        self.token = None
+        self.lock = threading.Lock()
+        self.stats = {'hits':0, 'disk_hits':0, 'misses':0, 'evictions':0, 'build_seconds':0.0, 'saved_seconds':0.0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def invalidate(self):
+        '''Drops every cached figure, in memory and on disk.'''
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.entries.clear()
+        if self.spill_dir:
+            for file_name in os.listdir(self.spill_dir):
+                os.remove(os.path.join(self.spill_dir, file_name))
+
+    def _spill_path(self, key:tuple):
+        return(os.path.join(self.spill_dir, hashlib.sha1(repr(key).encode()).hexdigest() + '.json'))
+
+    def get_or_build(self, key:tuple, build, token=None):
+        '''Returns the cached figure for key, building (and caching) it with build() on a miss.
+
+        The returned figure is shared with the cache and should not be modified.
+        '''
+        with self.lock:
+            if token != self.token:
+                self._clear()
+                self.token = token
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                fig, build_seconds = self.entries[key]
+                self.stats['hits'] += 1
+                self.stats['saved_seconds'] += build_seconds
+                return(fig)
+
+        if self.spill_dir and os.path.exists(self._spill_path(key)):
+            with open(self._spill_path(key), 'r') as json_file:
+                spilled = json.load(json_file)
+            fig, build_seconds = pio.from_json(spilled['figure']), spilled['build_seconds']
+            self.stats['disk_hits'] += 1
+            self.stats['saved_seconds'] += build_seconds
+        else:
+            start = time.perf_counter()
+            fig = build()
+            build_seconds = time.perf_counter() - start
+            self.stats['misses'] += 1
+            self.stats['build_seconds'] += build_seconds
+
+        with self.lock:
+            self.entries[key] = (fig, build_seconds)
+            while len(self.entries) > self.max_entries:
+                old_key, (old_fig, old_seconds) = self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+                if self.spill_dir:
+                    with open(self._spill_path(old_key), 'w') as json_file:
+                        json.dump({'build_seconds':old_seconds, 'figure':old_fig.to_json()}, json_file)
+        return(fig)
+
+    def hit_ratio(self):
+        '''Returns the share of lookups served without building a figure.'''
+        lookups = self.stats['hits'] + self.stats['disk_hits'] + self.stats['misses']
+        return((self.stats['hits'] + self.stats['disk_hits']) / lookups if lookups else 0.0)
+
+
+# In[22]:
+
+
+def cached_chart(chart_func):
+    '''Decorates a chart function so its figure is memoized in figure_cache and shown unless show=False.
+
+    The cache key is the chart name and the call's arguments (defaults filled in); the token is the current
+    backend and its data version, so switching or changing the dataset invalidates the cache. Each call is timed
+    as the chart.<name> span, cache hits included.
+    '''
+    signature = inspect.signature(chart_func)
+
+    @functools.wraps(chart_func)
+    def wrapper(*args, show:bool=True, **kwargs):
+        context.require('names', 'data')
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (chart_func.__name__,) + tuple(tuple(value) if isinstance(value, list) else value
+                                             for value in bound.arguments.values())
+        with metrics.span(f'chart.{chart_func.__name__}'):
+            fig = figure_cache.get_or_build(key, lambda: chart_func(*bound.args, **bound.kwargs),
+                                            (id(backend), backend.version))
+        if show:
+            fig.show()
+        return(fig)
+    return(wrapper)
+
+
+# In[23]:
+
+
+@cached_chart
+def line_ind(player_name:str, metric:str, season=None):
     '''Presents a line graph for an individual player.
+
+    Given several seasons, one line is drawn per season, assembled from that player's rows in each season's partition.
     
     Parameters
     ----------
@@ -144,23 +1036,42 @@ def line_ind(player_name:str, metric:str):
     
     metric: string
         The metric to be visualized.
+
+    season (optional): string or list
+        The season, e.g. '2019-20', or a list of seasons (see season_range). Defaults to CURRENT_SEASON.
         
     Returns
     -------
-    None
+    Figure
+        The chart. It is also displayed unless show=False is passed.
     '''
-    f_name = player_name.split()[0]
-    s_name = player_name.replace(f_name + " ","")
-    
-    fig = px.line(new_sample_data[(new_sample_data['first_name'] == f_name) & (new_sample_data['second_name'] == s_name)],
-                  x='round', y=metric,labels=labels_dict,title=f'Week-Wise {labels_dict[metric]} Trend for {player_name}')
-    fig.show()
+    if season is not None and not isinstance(season, str):
+        with metrics.span('chart.line_ind.filter'):
+            season_dfs = []
+            for one_season in season:
+                season_backend, season_names = season_context(one_season)
+                season_df = season_backend.player_rows(season_names.resolve(player_name), ['round', metric])
+                season_dfs.append(season_df.assign(season=one_season))
+        with metrics.span('chart.line_ind.aggregate'):
+            player_df = pd.concat(season_dfs, ignore_index=True)
+        with metrics.span('chart.line_ind.figure'):
+            fig = px.line(player_df, x='round', y=metric, color='season', labels=labels_dict,
+                          title=f'Week-Wise {labels_dict[metric]} Trend for {player_name}, {season[0]} to {season[-1]}')
+        return(fig)
+
+    season_backend, season_names = season_context(season)
+    with metrics.span('chart.line_ind.filter'):
+        player_df = season_backend.player_rows(season_names.resolve(player_name), ['round', metric])
+    with metrics.span('chart.line_ind.figure'):
+        fig = px.line(player_df, x='round', y=metric,labels=labels_dict,title=f'Week-Wise {labels_dict[metric]} Trend for {player_name}')
+    return(fig)
 
 
-# In[5]:
+# In[24]:
 
 
-def scatter_ind(player_name:str, metric1:str, metric2:str):
+@cached_chart
+def scatter_ind(player_name:str, metric1:str, metric2:str, season:str=None):
     '''Presents a scatter graph for an individual player.
     
     Parameters
@@ -174,21 +1085,28 @@ def scatter_ind(player_name:str, metric1:str, metric2:str):
     metric2: string
         The metric to be visualized on the y-axis.
 
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
     Returns
     -------
-    None
+    Figure
+        The chart. It is also displayed unless show=False is passed.
     '''
-    f_name = player_name.split()[0]
-    s_name = player_name.replace(f_name + " ","")
-    fig = px.scatter(new_sample_data[(new_sample_data['first_name'] == f_name) & (new_sample_data['second_name'] == s_name)],
-               x=metric1, y=metric2, hover_data=['round'], labels=labels_dict, title=f'Scatter Plot: {labels_dict[metric1]} vs {labels_dict[metric2]} Trend for {player_name}')
-    fig.show()
+    season_backend, season_names = season_context(season)
+    with metrics.span('chart.scatter_ind.filter'):
+        player_df = season_backend.player_rows(season_names.resolve(player_name), [metric1, metric2, 'round'])
+    with metrics.span('chart.scatter_ind.figure'):
+        fig = px.scatter(player_df,
+                   x=metric1, y=metric2, hover_data=['round'], labels=labels_dict, title=f'Scatter Plot: {labels_dict[metric1]} vs {labels_dict[metric2]} Trend for {player_name}')
+    return(fig)
 
 
-# In[6]:
+# In[25]:
 
 
-def line_mul(player_name1:str, player_name2:str, metric:str):
+@cached_chart
+def line_mul(player_name1:str, player_name2:str, metric:str, season:str=None):
     '''Presents a line graph for a pair of players.
     
     Parameters
@@ -201,31 +1119,36 @@ def line_mul(player_name1:str, player_name2:str, metric:str):
     
     metric: string
         The metric to be visualized.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
         
     Returns
     -------
-    None
+    Figure
+        The chart. It is also displayed unless show=False is passed.
     '''
-    
-    f_name1 = player_name1.split()[0]
-    s_name1 = player_name1.replace(f_name1 + " ","")
-    
-    f_name2 = player_name2.split()[0]
-    s_name2 = player_name2.replace(f_name2 + " ","")
-    
-    fig = px.line(new_sample_data[((new_sample_data['first_name'] == f_name1) &
-                                   (new_sample_data['second_name'] == s_name1))| 
-                                  ((new_sample_data['first_name'] == f_name2) &
-                                   (new_sample_data['second_name'] == s_name2))], x='round', y=metric,
-                  color='second_name', labels=labels_dict,
-                  title=f'Week-Wise {labels_dict[metric]} Trend for {player_name1} vs {player_name2}')
-    fig.show()
 
+    columns = ['round', 'second_name', metric]
+    season_backend, season_names = season_context(season)
+    with metrics.span('chart.line_mul.filter'):
+        player_df1 = season_backend.player_rows(season_names.resolve(player_name1), columns)
+        player_df2 = season_backend.player_rows(season_names.resolve(player_name2), columns)
+    with metrics.span('chart.line_mul.aggregate'):
+        players_df = pd.concat([player_df1, player_df2])
+    with metrics.span('chart.line_mul.figure'):
+        fig = px.line(players_df,
+                      x='round', y=metric,
+                      color='second_name', labels=labels_dict,
+                      title=f'Week-Wise {labels_dict[metric]} Trend for {player_name1} vs {player_name2}')
+    return(fig)
 
-# In[7]:
+
+# In[26]:
 
 
-def bar_mul(player_name1:str, player_name2:str, metric1:str, metric2=None):
+@cached_chart
+def bar_mul(player_name1:str, player_name2:str, metric1:str, metric2=None, season:str=None):
     '''Presents either a singular or grouped bar graph for a pair of players.
     
     Parameters
@@ -241,44 +1164,50 @@ def bar_mul(player_name1:str, player_name2:str, metric1:str, metric2=None):
         
     metric2 (optional): string
         The second metric to be visualized.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
     
     Returns
     -------
-    None
+    Figure
+        The chart. It is also displayed unless show=False is passed.
     '''
-    
-    f_name1 = player_name1.split()[0]
-    s_name1 = player_name1.replace(f_name1 + " ","")
-    
-    f_name2 = player_name2.split()[0]
-    s_name2 = player_name2.replace(f_name2 + " ","")
-    if metric2:
-        players=[labels_dict[metric1], labels_dict[metric2]]
-
-        fig = go.Figure(data=[go.Bar(name=player_name1,
-                                     x=players,
-                                     y=[new_sample_data.query("first_name==@f_name1 and second_name==@s_name1")[metric1].sum(),
-                                        new_sample_data.query("first_name==@f_name1 and second_name==@s_name1")[metric2].sum()]),
-                              go.Bar(name=player_name2,
-                                     x=players,
-                                     y=[new_sample_data.query("first_name==@f_name2 and second_name==@s_name2")[metric1].sum(),
-                                        new_sample_data.query("first_name==@f_name2 and second_name==@s_name2")[metric2].sum()])
-        ])
-
-        fig.update_layout(barmode='group')
-    else:
-        fig = px.bar(x=[player_name1, player_name2],
-                     y=[new_sample_data.query("first_name==@f_name1 and second_name==@s_name1")[metric1].sum(),
-                        new_sample_data.query("first_name==@f_name2 and second_name==@s_name2")[metric1].sum()],
-                     labels={'x':labels_dict[metric1],'y':'Value'},
-                     title = f'{player_name1} vs {player_name2}: {labels_dict[metric1]}')
-    fig.show()
+
+    columns = [metric1, metric2] if metric2 else [metric1]
+    season_backend, season_names = season_context(season)
+    with metrics.span('chart.bar_mul.filter'):
+        player_df1 = season_backend.player_rows(season_names.resolve(player_name1), columns)
+        player_df2 = season_backend.player_rows(season_names.resolve(player_name2), columns)
+    with metrics.span('chart.bar_mul.aggregate'):
+        totals1 = {metric:player_df1[metric].sum() for metric in columns}
+        totals2 = {metric:player_df2[metric].sum() for metric in columns}
+    with metrics.span('chart.bar_mul.figure'):
+        if metric2:
+            players=[labels_dict[metric1], labels_dict[metric2]]
+
+            fig = go.Figure(data=[go.Bar(name=player_name1,
+                                         x=players,
+                                         y=[totals1[metric1], totals1[metric2]]),
+                                  go.Bar(name=player_name2,
+                                         x=players,
+                                         y=[totals2[metric1], totals2[metric2]])
+            ])
+
+            fig.update_layout(barmode='group')
+        else:
+            fig = px.bar(x=[player_name1, player_name2],
+                         y=[totals1[metric1], totals2[metric1]],
+                         labels={'x':labels_dict[metric1],'y':'Value'},
+                         title = f'{player_name1} vs {player_name2}: {labels_dict[metric1]}')
+    return(fig)
 
 
-# In[8]:
+# In[27]:
 
 
-def scatter_mul(team:str, week:int, metric1:str, metric2:str):
+@cached_chart
+def scatter_mul(team:str, week:int, metric1:str, metric2:str, season:str=None):
     '''Presents a scatter graph for an entire team, for a specific gameweek.
     
     Parameters
@@ -295,65 +1224,2175 @@ def scatter_mul(team:str, week:int, metric1:str, metric2:str):
     metric2: string
         The metric to be visualized on the y-axis.
 
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
     Returns
     -------
-    None
+    Figure
+        The chart. It is also displayed unless show=False is passed.
+    '''
+    
+    season_backend, _ = season_context(season)
+    with metrics.span('chart.scatter_mul.filter'):
+        team_df = season_backend.team_week_rows(team.title(), week, [metric1, metric2, 'first_name', 'second_name'])
+    with metrics.span('chart.scatter_mul.figure'):
+        fig = px.scatter(team_df,
+                         x=metric1, y=metric2, hover_data=['first_name', 'second_name'], labels=labels_dict,
+                         title=f'Week {week} Comparison for {team.title()} ({labels_dict[metric1]} vs {labels_dict[metric2]})')
+    return(fig)
+
+
+# In[28]:
+
+
+# Above SCATTER_WEBGL_POINTS points scatter_league draws with WebGL; above SCATTER_DENSITY_POINTS it bins them.
+SCATTER_WEBGL_POINTS = 2000
+SCATTER_DENSITY_POINTS = 50000
+
+@cached_chart
+def scatter_league(metric1:str, metric2:str, players:list=None, first_week:int=None, last_week:int=None,
+                   mode:str='auto', bins:int=80, season:str=None):
+    '''Presents a scatter graph of every player's gameweeks across the league.
+
+    Up to SCATTER_WEBGL_POINTS points are drawn as SVG markers with the player and week on hover; beyond that
+    as a WebGL trace without per-point hover text; and beyond SCATTER_DENSITY_POINTS as a 2D histogram of
+    bins x bins cells, so the figure's size no longer grows with the number of rows. The given players are
+    drawn on top, with hover details, in every mode.
+
+    Parameters
+    ----------
+    metric1: string
+        The metric to be visualized on the x-axis.
+
+    metric2: string
+        The metric to be visualized on the y-axis.
+
+    players (optional): list
+        Names of players to highlight.
+
+    first_week (optional): int
+        The first gameweek included. Defaults to the first of the season.
+
+    last_week (optional): int
+        The last gameweek included. Defaults to the last of the season.
+
+    mode (optional): string
+        'auto' (by number of points), 'svg', 'webgl' or 'density'.
+
+    bins (optional): int
+        Number of histogram bins along each axis in 'density' mode.
+
+    season (optional): string or list
+        The season, e.g. '2019-20', or a list of seasons to draw together. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    Figure
+        The chart. It is also displayed unless show=False is passed.
+    '''
+    seasons = [season] if season is None or isinstance(season, str) else list(season)
+    with metrics.span('chart.scatter_league.filter'):
+        points, ids, weeks, names, highlights = [], [], [], {}, []
+        for one_season in seasons:
+            season_backend, season_names = season_context(one_season)
+            rows = season_backend.gameweek_rows(['id', 'round', metric1, metric2])
+            week = rows['round'].to_numpy()
+            keep = np.ones(len(rows), dtype=bool)
+            if first_week is not None:
+                keep &= week >= first_week
+            if last_week is not None:
+                keep &= week <= last_week
+            rows = rows[keep]
+            points.append(rows[[metric1, metric2]].to_numpy(dtype=np.float64))
+            ids.append(rows['id'].to_numpy())
+            weeks.append(rows['round'].to_numpy())
+            names.update(season_names.names)
+            for name in players or []:
+                player_rows = rows[rows['id'] == season_names.resolve(name)]
+                highlights.append((name if len(seasons) == 1 else f'{name} ({one_season})', player_rows))
+        points, ids, weeks = np.concatenate(points), np.concatenate(ids), np.concatenate(weeks)
+
+    if mode == 'auto':
+        mode = ('svg' if len(points) <= SCATTER_WEBGL_POINTS else
+                'webgl' if len(points) <= SCATTER_DENSITY_POINTS else 'density')
+    with metrics.span('chart.scatter_league.aggregate'):
+        if mode == 'density':
+            counts, x_edges, y_edges = np.histogram2d(points[:, 0], points[:, 1], bins=bins)
+            counts[counts == 0] = np.nan
+
+    with metrics.span('chart.scatter_league.figure'):
+        x_label, y_label = labels_dict[metric1], labels_dict[metric2]
+        if mode == 'density':
+            trace = go.Heatmap(x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2, z=counts.T,
+                               colorscale='Viridis', colorbar={'title':'Gameweeks'},
+                               hovertemplate=f'{x_label}: %{{x}}<br>{y_label}: %{{y}}<br>Gameweeks: %{{z}}<extra></extra>')
+        elif mode == 'webgl':
+            trace = go.Scattergl(x=points[:, 0], y=points[:, 1], mode='markers', name='All players',
+                                 marker={'size':4, 'opacity':0.3}, hoverinfo='x+y')
+        else:
+            trace = go.Scatter(x=points[:, 0], y=points[:, 1], mode='markers', name='All players',
+                               marker={'size':6, 'opacity':0.5},
+                               text=[f'{names.get(player_id, player_id)}, Week {week}' for player_id, week in zip(ids.tolist(), weeks.tolist())],
+                               hovertemplate=f'%{{text}}<br>{x_label}: %{{x}}<br>{y_label}: %{{y}}<extra></extra>')
+        fig = go.Figure(data=[trace])
+        for name, player_rows in highlights:
+            fig.add_trace(go.Scatter(x=player_rows[metric1], y=player_rows[metric2], mode='markers', name=name,
+                                     marker={'size':9, 'line':{'width':1, 'color':'white'}},
+                                     text=[f'{name}, Week {week}' for week in player_rows['round'].tolist()],
+                                     hovertemplate=f'%{{text}}<br>{x_label}: %{{x}}<br>{y_label}: %{{y}}<extra></extra>'))
+
+        weeks_title = '' if first_week is None and last_week is None else f', Weeks {first_week or 1} to {last_week or int(weeks.max())}'
+        seasons_title = '' if len(seasons) == 1 else f', {seasons[0]} to {seasons[-1]}'
+        fig.update_layout(title=f'League-Wide Scatter Plot: {x_label} vs {y_label}{weeks_title}{seasons_title}',
+                          xaxis_title=x_label, yaxis_title=y_label)
+    return(fig)
+
+
+# In[29]:
+
+
+@cached_chart
+def radar_mul(player_name1:str, player_name2:str, metric_list:list, season:str=None):
+    '''Presents a radar graph for a pair of players for 5 metrics.
+    
+    Parameters
+    ----------
+    player_name1: string
+        The name of the first player being searched for.
+        
+    player_name2: string
+        The name of the second player being searched for.
+    
+    metric_list: list
+        The list of metrics to be visualized.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    Figure
+        The chart. It is also displayed unless show=False is passed.
     '''
     
-    fig = px.scatter(new_sample_data[(new_sample_data['round']==week) & (new_sample_data['team']==team.title())],
-                     x=metric1, y=metric2, hover_data=['first_name', 'second_name'], labels=labels_dict,
-                     title=f'Week {week} Comparison for {team.title()} ({labels_dict[metric1]} vs {labels_dict[metric2]})')
-    fig.show()
+    categories = metric_list
+    season_backend, season_names = season_context(season)
+    with metrics.span('chart.radar_mul.filter'):
+        season_rows = season_backend.season_rows([season_names.resolve(player_name1), season_names.resolve(player_name2)], categories)
+    with metrics.span('chart.radar_mul.aggregate'):
+        metric_max = season_backend.metric_max(categories)
+        r1, r2 = season_rows[categories].to_numpy(dtype=np.float64) * 5 / metric_max[categories].to_numpy(dtype=np.float64)
+
+    with metrics.span('chart.radar_mul.figure'):
+        fig = go.Figure()
+
+        fig.add_trace(go.Scatterpolar(
+              r=r1,
+              theta=categories,
+              fill='toself',
+              name=player_name1))
+
+        fig.add_trace(go.Scatterpolar(
+              r=r2,
+              theta=categories,
+              fill='toself',
+              name=player_name2))
+
+        fig.update_layout(polar=dict(radialaxis=dict(visible=True,range=[0, 5])),
+                          showlegend=True,
+                          title = f'Radar Plot: {player_name1} vs {player_name2}')
+
+    return(fig)
+
+
+# In[30]:
+
+
+@cached_chart
+def radar_similar(player_name:str, metric_list:list, k:int=3, method:str='cosine', season:str=None):
+    '''Presents a radar graph of a player and the k players most similar to them over the given metrics.
+
+    Parameters
+    ----------
+    player_name: string
+        The name of the player being searched for.
+
+    metric_list: list
+        The list of metrics to be compared and visualized.
+
+    k (optional): int
+        Number of similar players shown.
+
+    method (optional): string
+        'cosine' or 'euclidean' (see SimilarityIndex.similar).
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    Figure
+        The chart. It is also displayed unless show=False is passed.
+    '''
+    categories = metric_list
+    season_backend, season_names = season_context(season)
+    with metrics.span('chart.radar_similar.filter'):
+        matches = similar_players(player_name, categories, k, method, season)
+        player_ids = [season_names.resolve(player_name)] + matches['id'].tolist()
+        season_rows = season_backend.season_rows(player_ids, categories)
+    with metrics.span('chart.radar_similar.aggregate'):
+        metric_max = season_backend.metric_max(categories)
+        radii = season_rows[categories].to_numpy(dtype=np.float64) * 5 / metric_max[categories].to_numpy(dtype=np.float64)
+
+    with metrics.span('chart.radar_similar.figure'):
+        fig = go.Figure()
+        for name, r in zip([player_name] + matches['name'].tolist(), radii):
+            fig.add_trace(go.Scatterpolar(r=r, theta=categories, fill='toself', name=name))
+
+        fig.update_layout(polar=dict(radialaxis=dict(visible=True,range=[0, 5])),
+                          showlegend=True,
+                          title = f'Radar Plot: Players Most Similar to {player_name}')
+
+    return(fig)
+
+
+# In[31]:
+
+
+@cached_chart
+def team_trend(team:str, metric:str, season:str=None):
+    '''Presents a line graph of a team's week-wise total (or average) of a metric.
+
+    Parameters
+    ----------
+    team: string
+        The name of the team being searched for.
+
+    metric: string
+        The metric to be visualized.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    Figure
+        The chart. It is also displayed unless show=False is passed.
+    '''
+    with metrics.span('chart.team_trend.aggregate'):
+        trend = team_cube(season).trend(team.title(), metric)
+    with metrics.span('chart.team_trend.figure'):
+        fig = px.line(x=trend.index, y=trend.values, labels={'x':'Round', 'y':labels_dict[metric]},
+                      title=f'Week-Wise {labels_dict[metric]} Trend for {team.title()}')
+    return(fig)
+
+
+# In[32]:
+
+
+@cached_chart
+def team_vs_team(team1:str, team2:str, metric_list:list, season:str=None):
+    '''Presents a grouped bar graph of two teams' season totals (or averages) for a list of metrics.
+
+    Parameters
+    ----------
+    team1: string
+        The name of the first team being searched for.
+
+    team2: string
+        The name of the second team being searched for.
+
+    metric_list: list
+        The list of metrics to be visualized.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    Figure
+        The chart. It is also displayed unless show=False is passed.
+    '''
+    with metrics.span('chart.team_vs_team.aggregate'):
+        cube = team_cube(season)
+        totals1, totals2 = cube.season(team1.title(), metric_list), cube.season(team2.title(), metric_list)
+    with metrics.span('chart.team_vs_team.figure'):
+        labels = [labels_dict[metric] for metric in metric_list]
+        fig = go.Figure(data=[go.Bar(name=team1.title(), x=labels, y=totals1.values),
+                              go.Bar(name=team2.title(), x=labels, y=totals2.values)])
+        fig.update_layout(barmode='group', title=f'{team1.title()} vs {team2.title()}')
+    return(fig)
+
+
+# In[33]:
+
+
+def compare_players(player_names:list, metric_list:list, season:str=None):
+    '''Computes the week-wise series, season totals and season values of any number of metrics for any number of players.
+
+    All the players' rows are selected together (players_rows) and aggregated in one groupby, so the cost
+    grows with the rows selected, not with the number of players times metrics.
+
+    Parameters
+    ----------
+    player_names: list
+        The names of the players being searched for.
+
+    metric_list: list
+        The metrics to be compared.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    dict
+        'series': one row per player and round, with a player column (the names as given) and the summed metrics;
+        'totals': the season sums, indexed by player; 'season': the season-long values (means for averaged
+        metrics, as radar_df) scaled 0-5 against the league's largest, indexed by player. Players are in the
+        order given.
+    '''
+    season_backend, season_names = season_context(season)
+    players = {}
+    for name in player_names:
+        player_id = season_names.resolve(name)
+        if player_id is None:
+            raise KeyError(f'Unknown player: {name}')
+        players.setdefault(player_id, name)
+    ids, metric_list = list(players), list(dict.fromkeys(metric_list))
+
+    with metrics.span('compare.filter'):
+        rows = season_backend.players_rows(ids, ['id', 'round'] + metric_list)
+    with metrics.span('compare.aggregate'):
+        series = rows.groupby(['id', 'round'])[metric_list].sum()
+        totals = series.groupby(level='id').sum().reindex(ids, fill_value=0)
+        totals.index = pd.Index([players[player_id] for player_id in ids], name='player')
+
+        series = series.reset_index()
+        order = {player_id:i for i, player_id in enumerate(ids)}
+        series = series.iloc[np.lexsort((series['round'].to_numpy(), series['id'].map(order).to_numpy()))]
+        series.insert(0, 'player', series.pop('id').map(players).to_numpy())
+
+        scaled = (season_backend.season_rows(ids, metric_list).to_numpy(dtype=np.float64) * 5
+                  / season_backend.metric_max(metric_list)[metric_list].to_numpy(dtype=np.float64))
+        season_values = pd.DataFrame(scaled, index=totals.index, columns=metric_list)
+    return({'series':series.reset_index(drop=True), 'totals':totals, 'season':season_values})
+
+
+# In[34]:
+
+
+@cached_chart
+def line_players(player_names:list, metric:str, season:str=None):
+    '''Presents a line graph of a metric for any number of players.
+
+    Parameters
+    ----------
+    player_names: list
+        The names of the players being searched for.
+
+    metric: string
+        The metric to be visualized.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    Figure
+        The chart. It is also displayed unless show=False is passed.
+    '''
+    comparison = compare_players(player_names, [metric], season)
+    with metrics.span('chart.line_players.figure'):
+        fig = px.line(comparison['series'], x='round', y=metric, color='player', labels=labels_dict,
+                      title=f'Week-Wise {labels_dict[metric]} Trend for {", ".join(comparison["totals"].index)}')
+    return(fig)
+
+
+# In[35]:
+
+
+@cached_chart
+def bar_players(player_names:list, metric_list:list, season:str=None):
+    '''Presents a grouped bar graph of season totals for any number of players and metrics.
+
+    Parameters
+    ----------
+    player_names: list
+        The names of the players being searched for.
+
+    metric_list: list
+        The list of metrics to be visualized.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    Figure
+        The chart. It is also displayed unless show=False is passed.
+    '''
+    totals = compare_players(player_names, metric_list, season)['totals']
+    with metrics.span('chart.bar_players.figure'):
+        labels = [labels_dict[metric] for metric in totals.columns]
+        fig = go.Figure(data=[go.Bar(name=name, x=labels, y=values) for name, values in zip(totals.index, totals.to_numpy())])
+        fig.update_layout(barmode='group', title=f'Season Totals: {", ".join(totals.index)}')
+    return(fig)
+
+
+# In[36]:
+
+
+@cached_chart
+def radar_players(player_names:list, metric_list:list, season:str=None):
+    '''Presents a radar plot comparing any number of players over a list of metrics.
+
+    Each metric is scaled 0-5 against the league's largest season-long value, as in radar_mul.
+
+    Parameters
+    ----------
+    player_names: list
+        The names of the players being searched for.
+
+    metric_list: list
+        The list of metrics to be visualized.
+
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    Figure
+        The chart. It is also displayed unless show=False is passed.
+    '''
+    season_values = compare_players(player_names, metric_list, season)['season']
+    with metrics.span('chart.radar_players.figure'):
+        fig = go.Figure(data=[go.Scatterpolar(r=values, theta=list(season_values.columns), fill='toself', name=name)
+                              for name, values in zip(season_values.index, season_values.to_numpy())])
+        fig.update_layout(polar=dict(radialaxis=dict(visible=True, range=[0, 5])), showlegend=True,
+                          title=f'Radar Plot: {", ".join(season_values.index)}')
+    return(fig)
+
+
+# In[37]:
+
+
+def fold_name(name:str):
+    '''Normalizes a name for matching: accents removed, lower case, hyphens/apostrophes/dots read as spaces.
+
+    Parameters
+    ----------
+    name: string
+        The name to normalize.
+
+    Returns
+    -------
+    string
+        The normalized name.
+    '''
+    name = unicodedata.normalize('NFKD', name.translate(NAME_FOLDS))
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch)).lower()
+    return(' '.join(re.sub(r"[-'’.]", ' ', name).split()))
+
+NAME_FOLDS = str.maketrans({'ø':'o', 'Ø':'O', 'ß':'ss', 'æ':'ae', 'Æ':'Ae', 'ł':'l', 'Ł':'L', 'đ':'d', 'Đ':'D', 'ı':'i'})
+
+
+# In[38]:
+
+
+class NameIndex:
+    '''Resolves typed player names to player ids, tolerating accents, partial names and typos.
+
+    Built once over the player id list. Names are folded (see fold_name) and indexed three ways:
+    a dictionary for exact matches and whole-word lookups, a sorted list for prefix matches,
+    and a trigram index for fuzzy matches.
+
+    Parameters
+    ----------
+    name_data: DataFrame or dict
+        The player id list, with first_name, second_name and id columns.
+    '''
+    def __init__(self, name_data:pd.DataFrame):
+        self.names, self.first, self.second = {}, {}, {}
+        self.exact = {}
+        self.words = defaultdict(set)
+        self.trigrams = defaultdict(set)
+        self.keys = {}
+        self.sorted_keys = []
+        for f_name, s_name, player_id in zip(name_data['first_name'], name_data['second_name'], name_data['id']):
+            self.add(int(player_id), f_name, s_name, sort=False)
+        self.sorted_keys.sort()
+
+    def add(self, player_id:int, f_name:str, s_name:str, sort:bool=True):
+        '''Adds one player to the index (sort=False defers keeping the prefix list sorted, for bulk loads).'''
+        key = fold_name(f_name + ' ' + s_name)
+        self.names[player_id], self.first[player_id], self.second[player_id] = f_name + ' ' + s_name, f_name, s_name
+        self.keys[player_id] = key
+        self.exact[key] = player_id
+        for word in key.split():
+            self.words[word].add(player_id)
+        for gram in self._trigrams(key):
+            self.trigrams[gram].add(player_id)
+        for sort_key in [(key, player_id), (fold_name(s_name), player_id)]:
+            if sort:
+                bisect.insort(self.sorted_keys, sort_key)
+            else:
+                self.sorted_keys.append(sort_key)
+
+    @staticmethod
+    def _trigrams(key:str):
+        padded = f'  {key} '
+        return({padded[i:i+3] for i in range(len(padded) - 2)})
+
+    def match_words(self, query:str):
+        '''Returns the ids of players whose name contains every word of the query.'''
+        words = fold_name(query).split()
+        if not words or any(word not in self.words for word in words):
+            return(set())
+        return(set.intersection(*[self.words[word] for word in words]))
+
+    def prefix(self, query:str, limit:int=10):
+        '''Returns the ids of players whose full name or second name starts with the query.'''
+        key = fold_name(query)
+        start = bisect.bisect_left(self.sorted_keys, (key, -1))
+        ids = []
+        for candidate, player_id in self.sorted_keys[start:]:
+            if not candidate.startswith(key) or len(ids) >= limit:
+                break
+            if player_id not in ids:
+                ids.append(player_id)
+        return(ids)
+
+    def fuzzy(self, query:str, limit:int=5):
+        '''Returns up to limit (id, score) pairs for the closest names, best first. Scores run from 0 to 1.'''
+        key = fold_name(query)
+        overlap = defaultdict(int)
+        for gram in self._trigrams(key):
+            for player_id in self.trigrams.get(gram, ()):
+                overlap[player_id] += 1
+        candidates = sorted(overlap, key=overlap.get, reverse=True)[:max(20, limit)]
+        scored = [(player_id, difflib.SequenceMatcher(None, key, self.keys[player_id]).ratio()) for player_id in candidates]
+        return(sorted(scored, key=lambda pair: pair[1], reverse=True)[:limit])
+
+    def resolve(self, query:str):
+        '''Returns the id of the one player the query refers to, or None if there is no confident match.
+
+        Tries, in order: the exact (folded) full name, a unique player containing all the query's words,
+        a unique prefix match, and a fuzzy match that is both close and clearly ahead of the runner-up.
+        A query whose words match several players is ambiguous and is not passed on to the looser matches.
+        '''
+        key = fold_name(query)
+        if key in self.exact:
+            return(self.exact[key])
+        matches = self.match_words(query)
+        if matches:
+            return(next(iter(matches)) if len(matches) == 1 else None)
+        matches = self.prefix(query, limit=2)
+        if len(matches) == 1:
+            return(matches[0])
+        scored = self.fuzzy(query, limit=2)
+        if scored and scored[0][1] >= 0.75 and (len(scored) == 1 or scored[0][1] - scored[1][1] >= 0.05):
+            return(scored[0][0])
+        return(None)
+
+
+# In[39]:
+
+
+MEAN_METRICS = ('ict_index', 'selected', 'transfers_balance', 'value', 'ppm')
+
+def season_aggregates(data:pd.DataFrame, mean_metrics:tuple=MEAN_METRICS):
+    '''Builds the season-long table of per-player totals/averages in one grouped pass.
+
+    Parameters
+    ----------
+    data: DataFrame
+        Gameweek-level data, laid out like new_sample_data.
+
+    mean_metrics (optional): tuple
+        The metrics to be averaged across the season. Every other metric is summed.
+
+    Returns
+    -------
+    DataFrame
+        One row per player id with the player's name and a column per metric.
+    '''
+    metric_names = list(data.columns[6:])
+    grouped = data.groupby(by='id', sort=True)
+
+    totals = grouped[metric_names].agg({metric: ('mean' if metric in mean_metrics else 'sum') for metric in metric_names})
+    names = grouped[['first_name', 'second_name']].first()
+
+    season_df = pd.DataFrame({'id':totals.index.values,
+                              'name':(names['first_name'] + ' ' + names['second_name']).values})
+    for metric in metric_names:
+        season_df[metric] = totals[metric].values
+    return(season_df)
+
+
+# In[40]:
+
+
+def update_season_aggregates(season_df:pd.DataFrame, delta:pd.DataFrame, row_counts:dict, mean_metrics:tuple=MEAN_METRICS):
+    '''Folds new gameweek rows into the season-long table without revisiting the earlier rows.
+
+    Summed metrics get the new rows' totals added; averaged metrics are updated as running means,
+    weighting the old mean by the number of rows it was taken over. New players are added.
+
+    Parameters
+    ----------
+    season_df: DataFrame
+        The season-long table (see season_aggregates).
+
+    delta: DataFrame
+        The new gameweek rows, laid out like new_sample_data.
+
+    row_counts: dict
+        Dictionary of player id to the number of gameweek rows already aggregated into season_df.
+
+    mean_metrics (optional): tuple
+        The metrics averaged across the season. Every other metric is summed.
+
+    Returns
+    -------
+    DataFrame
+        The updated season-long table, one row per player id in id order.
+    '''
+    metric_names = list(delta.columns[6:])
+    grouped = delta.groupby(by='id', sort=True)
+    totals = grouped[metric_names].sum()
+    new_counts = grouped.size()
+    old_counts = np.array([row_counts.get(int(player_id), 0) for player_id in totals.index])
+
+    season = season_df.set_index('id')
+    added = totals.index.difference(season.index)
+    if len(added):
+        names = grouped[['first_name', 'second_name']].first().loc[added]
+        new_rows = pd.DataFrame({'name':(names['first_name'] + ' ' + names['second_name']).values}, index=added)
+        for metric in metric_names:
+            new_rows[metric] = np.zeros(len(added), dtype=season[metric].dtype)
+        season = pd.concat([season, new_rows]).sort_index()
+
+    for metric in metric_names:
+        old = season.loc[totals.index, metric].to_numpy()
+        if metric in mean_metrics:
+            season.loc[totals.index, metric] = (old * old_counts + totals[metric].to_numpy()) / (old_counts + new_counts.to_numpy())
+        else:
+            season.loc[totals.index, metric] = old + totals[metric].to_numpy()
+    season.index.name = 'id'
+    return(season.reset_index())
+
+
+# In[41]:
+
+
+def build_player_index(data:pd.DataFrame):
+    '''Sorts the gameweek data by player and round, and records where each player's block of rows lives.
+
+    Parameters
+    ----------
+    data: DataFrame
+        Gameweek-level data, laid out like new_sample_data.
+
+    Returns
+    -------
+    tuple
+        The sorted copy of the data and a dictionary of player id to the slice holding that player's rows.
+    '''
+    sorted_data = data.sort_values(by=['id', 'round'], kind='stable').reset_index(drop=True)
+
+    ids = sorted_data['id'].values
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    stops = np.r_[starts[1:], len(ids)]
+
+    index = {int(ids[start]):slice(int(start), int(stop)) for start, stop in zip(starts, stops)}
+    return(sorted_data, index)
+
+
+# In[42]:
+
+
+class MemoryBackend:
+    '''Serves chart data from the in-memory gameweek table, using the player index for lookups.
+
+    Gameweeks ingested later (see append) are kept as separate segments, each with its own player index
+    and (team, round) group index, so adding one never re-sorts or copies the rows already loaded.
+
+    Parameters
+    ----------
+    player_data: DataFrame
+        Gameweek data sorted by player id and round (see build_player_index), in the compact schema
+        (see compact_frame). Rows are returned with their original dtypes.
+
+    player_index: dict
+        Dictionary of player id to the slice holding that player's rows.
+
+    radar_df: DataFrame
+        The season-long per-player table (see season_aggregates).
+    '''
+    def __init__(self, player_data:pd.DataFrame, player_index:dict, radar_df:pd.DataFrame):
+        self.player_data = player_data
+        self.player_index = player_index
+        self.segments = [(player_data, player_index, self._team_round_index(player_data))]
+        self.row_counts = {player_id:rows.stop - rows.start for player_id, rows in player_index.items()}
+        self.radar_df = radar_df
+        self.radar_ids = pd.Index(radar_df['id'])
+        self.version = 0
+
+    @staticmethod
+    def _team_round_index(data:pd.DataFrame):
+        # Dictionary of (team, round) to the positions of that group's rows, from one stable sort.
+        teams, rounds = data['team'].astype(str).to_numpy(), data['round'].to_numpy()
+        order = np.lexsort((rounds, teams))
+        keys = list(zip(teams[order].tolist(), rounds[order].tolist()))
+        starts = [i for i in range(len(keys)) if i == 0 or keys[i] != keys[i - 1]] + [len(keys)]
+        return({keys[start]:order[start:stop] for start, stop in zip(starts[:-1], starts[1:])})
+
+    @property
+    def rounds(self):
+        '''The set of gameweeks loaded.'''
+        return({week for _, _, groups in self.segments for _, week in groups})
+
+    def player_rows(self, player_id:int, columns:list):
+        '''Returns the given columns of a player's gameweek rows, ordered by round (empty if the player is not found).'''
+        columns = list(dict.fromkeys(columns))
+        parts = [widen_frame(data.iloc[index[player_id]][columns]) for data, index, _ in self.segments if player_id in index]
+        if not parts:
+            return(widen_frame(self.player_data.iloc[0:0][columns]))
+        return(parts[0] if len(parts) == 1 else pd.concat(parts))
+
+    def team_week_rows(self, team:str, week:int, columns:list):
+        '''Returns the given columns of a team's rows for one gameweek.'''
+        columns = list(dict.fromkeys(columns))
+        parts = [widen_frame(data.iloc[groups[(team, week)]][columns])
+                 for data, _, groups in self.segments if (team, week) in groups]
+        if not parts:
+            return(widen_frame(self.player_data.iloc[0:0][columns]))
+        return(parts[0] if len(parts) == 1 else pd.concat(parts))
+
+    def players_rows(self, player_ids:list, columns:list):
+        '''Returns the given columns of several players' gameweek rows, selected with one isin per segment.'''
+        columns = list(dict.fromkeys(columns))
+        parts = [widen_frame(data[data['id'].isin(player_ids)][columns]) for data, _, _ in self.segments]
+        return(parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True))
+
+    def season_rows(self, player_ids:list, metric_names:list):
+        '''Returns the season-long values of the given metrics, one row per player in the order given.'''
+        positions = self.radar_ids.get_indexer(list(player_ids))
+        if (positions < 0).any():
+            raise KeyError([player_id for player_id, position in zip(player_ids, positions) if position < 0])
+        return(self.radar_df.iloc[positions][list(dict.fromkeys(metric_names))].reset_index(drop=True))
+
+    def metric_max(self, metric_names:list):
+        '''Returns the largest season-long value of each metric across all players.'''
+        return(self.radar_df[list(dict.fromkeys(metric_names))].max())
+
+    def season_table(self):
+        '''Returns the season-long table of every player (see season_aggregates).'''
+        return(self.radar_df)
+
+    def gameweek_rows(self, columns:list):
+        '''Returns the given columns of every gameweek row.'''
+        columns = list(dict.fromkeys(columns))
+        parts = [widen_frame(data[columns]) for data, _, _ in self.segments]
+        return(parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True))
+
+    def append(self, delta:pd.DataFrame):
+        '''Adds new gameweek rows (full precision, laid out like new_sample_data) and updates the season table.'''
+        self.radar_df = update_season_aggregates(self.radar_df, delta, self.row_counts)
+        self.radar_ids = pd.Index(self.radar_df['id'])
+        data, index = build_player_index(compact_frame(delta))
+        self.segments.append((data, index, self._team_round_index(data)))
+        for player_id, rows in index.items():
+            self.row_counts[player_id] = self.row_counts.get(player_id, 0) + rows.stop - rows.start
+        self.version += 1
+
+
+# In[43]:
+
+
+GAMEWEEK_METRICS = ['total_points', 'minutes', 'goals_scored', 'assists', 'bonus', 'clean_sheets', 'goals_conceded',
+                    'ict_index', 'own_goals', 'penalties_missed', 'penalties_saved', 'red_cards', 'saves', 'selected',
+                    'transfers_balance', 'value', 'yellow_cards', 'ppm']
+CATEGORY_COLUMNS = ('first_name', 'second_name', 'team', 'opponent_team')
+# Metrics published to one decimal place: float32 holds them to within rounding, so they are stored
+# as float32 and rounded back to these decimals on the way out. ppm is a ratio and stays float64.
+FLOAT32_METRICS = {'ict_index':1, 'value':1}
+
+
+# In[44]:
+
+
+def compact_frame(data:pd.DataFrame):
+    '''Converts gameweek data to the compact schema: categorical names/teams, downcast integers, float32 for one-decimal metrics.
+
+    Parameters
+    ----------
+    data: DataFrame
+        Gameweek-level data, laid out like new_sample_data.
+
+    Returns
+    -------
+    DataFrame
+        A compact copy of the data.
+    '''
+    compact = {}
+    for col in data.columns:
+        if col in CATEGORY_COLUMNS:
+            compact[col] = data[col].astype('category')
+        elif col in FLOAT32_METRICS:
+            compact[col] = data[col].astype(np.float32)
+        elif data[col].dtype.kind in 'iu':
+            compact[col] = pd.to_numeric(data[col], downcast='integer')
+        else:
+            compact[col] = data[col]
+    return(pd.DataFrame(compact, index=data.index))
+
+
+# In[45]:
+
+
+def widen_frame(data:pd.DataFrame):
+    '''Restores rows in the compact schema to the dtypes of the CSV load (int64, float64 and strings).
+
+    Parameters
+    ----------
+    data: DataFrame
+        Gameweek rows in the compact schema (see compact_frame).
+
+    Returns
+    -------
+    DataFrame
+        The same rows with their original dtypes.
+    '''
+    wide = {}
+    for col in data.columns:
+        values = data[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            wide[col] = values.astype(values.cat.categories.dtype)
+        elif col in FLOAT32_METRICS:
+            wide[col] = values.astype(np.float64).round(FLOAT32_METRICS[col])
+        elif values.dtype.kind in 'iu' and values.dtype != np.int64:
+            wide[col] = values.astype(np.int64)
+        else:
+            wide[col] = values
+    return(pd.DataFrame(wide, index=data.index))
+
+
+# In[46]:
+
+
+def read_gameweeks(gameweek_path:str, name_data:pd.DataFrame):
+    '''Reads a gameweek-level CSV file (the whole season or a single round) into the layout of new_sample_data.
+
+    Only the columns that make it into the gameweek table are parsed.
+
+    Parameters
+    ----------
+    gameweek_path: string
+        Path to the gameweek-level CSV file.
+
+    name_data: DataFrame
+        The player id list, with id, first_name and second_name columns.
+
+    Returns
+    -------
+    DataFrame
+        The gameweek rows with player names, at full precision.
+    '''
+    df_vis = pd.read_csv(gameweek_path, usecols=['element', 'round', 'team', 'opponent_team'] + GAMEWEEK_METRICS)
+    gameweeks = pd.merge(df_vis, name_data, left_on='element', right_on='id')
+    return(gameweeks[['id', 'round', 'first_name', 'second_name', 'team', 'opponent_team'] + GAMEWEEK_METRICS])
+
+
+# In[47]:
+
+
+def build_lookups(columns:list, teams:list):
+    '''Builds the display label of each gameweek column and the numbering of the teams.
+
+    Parameters
+    ----------
+    columns: list
+        The columns of the gameweek table.
+
+    teams: list
+        The teams in the gameweek table.
+
+    Returns
+    -------
+    tuple
+        labels_dict (column to label) and team_dict (number, as a string, to team in alphabetical order).
+    '''
+    labels_dict = {}
+    for metric in columns:
+        if "_" in str(metric):
+            labels_dict.update({str(metric): str(metric).replace("_", " ").title()})
+        elif metric == "ppm":
+            labels_dict.update({str(metric): 'Points per Million'})
+        elif metric == "ict_index":
+            labels_dict.update({str(metric): 'ICT Index'})
+        else:
+            labels_dict.update({str(metric): str(metric).title()})
+
+    team_dict = {}
+    for i, team in enumerate(sorted(set(teams))):
+        team_dict.update({str(i+1):team})
+    return(labels_dict, team_dict)
+
+
+# In[48]:
+
+
+def load_csv_data(gameweek_path:str='players_1920_fin.csv', names_path:str='player_idlist.csv', compact:bool=True):
+    '''Reads the raw CSV files and builds the gameweek table along with its derived lookups.
+
+    Parameters
+    ----------
+    gameweek_path (optional): string
+        Path to the gameweek-level CSV file.
+
+    names_path (optional): string
+        Path to the player id/name CSV file.
+
+    compact (optional): boolean
+        Whether to return the gameweek table in the compact schema (see compact_frame). True by default.
+
+    Returns
+    -------
+    tuple
+        new_sample_data, radar_df, labels_dict and team_dict.
+    '''
+    new_sample_data = read_gameweeks(gameweek_path, pd.read_csv(names_path))
+    labels_dict, team_dict = build_lookups(new_sample_data.columns, new_sample_data['team'].unique())
+
+    # Season aggregates are taken at full precision, before compacting.
+    radar_df = season_aggregates(new_sample_data)
+    if compact:
+        new_sample_data = compact_frame(new_sample_data)
+
+    return(new_sample_data, radar_df, labels_dict, team_dict)
+
+
+# In[49]:
+
+
+def source_signature(paths:list):
+    '''Returns the size and modification time of each source file, used to tell when a snapshot is stale.
+
+    Parameters
+    ----------
+    paths: list
+        Paths of the files the snapshot is built from.
+
+    Returns
+    -------
+    dict
+        Dictionary of path to [size, modification time in ns].
+    '''
+    return({path:[os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in paths})
+
+
+# In[50]:
+
+
+SNAPSHOT_VERSION = 2
+
+
+# In[51]:
+
+
+def write_snapshot(snapshot_dir:str, frames:dict, lookups:dict, sources:list):
+    '''Writes DataFrames to a columnar snapshot: one .npy file per column plus a JSON manifest.
+
+    String and categorical columns are stored as integer codes, with their distinct values kept in the manifest.
+    The snapshot is written to a uniquely named temporary directory next to snapshot_dir and then renamed into
+    place, so concurrent writers (processes, service threads) never share files.
+
+    Parameters
+    ----------
+    snapshot_dir: string
+        Directory the snapshot is written to.
+
+    frames: dict
+        Dictionary of frame name to DataFrame.
+
+    lookups: dict
+        Dictionary of JSON-serializable objects (e.g. labels_dict, team_dict) stored in the manifest.
+
+    sources: list
+        Paths of the files the frames were built from.
+
+    Returns
+    -------
+    None
+    '''
+    parent_dir = os.path.dirname(os.path.abspath(snapshot_dir)) or '.'
+    prefix = os.path.basename(os.path.abspath(snapshot_dir)) + '.'
+    tmp_dir = tempfile.mkdtemp(prefix=prefix, suffix='.tmp', dir=parent_dir)
+    try:
+        manifest = {'version':SNAPSHOT_VERSION, 'sources':source_signature(sources), 'lookups':lookups, 'frames':{}}
+
+        for frame_name, frame in frames.items():
+            columns = []
+            for i, col in enumerate(frame.columns):
+                file_name = f'{frame_name}.{i}.npy'
+                column = {'name':col, 'file':file_name, 'dtype':str(frame[col].dtype)}
+                if isinstance(frame[col].dtype, pd.CategoricalDtype):
+                    np.save(os.path.join(tmp_dir, file_name), frame[col].cat.codes.to_numpy())
+                    column['categories'] = [str(x) for x in frame[col].cat.categories]
+                elif frame[col].dtype.kind in 'biuf':
+                    np.save(os.path.join(tmp_dir, file_name), frame[col].to_numpy())
+                else:
+                    codes, uniques = pd.factorize(frame[col])
+                    np.save(os.path.join(tmp_dir, file_name), codes.astype(np.int32))
+                    column['categories'] = [str(x) for x in uniques]
+                columns.append(column)
+            manifest['frames'][frame_name] = columns
+
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as json_file:
+            json.dump(manifest, json_file)
+
+        if os.path.isdir(snapshot_dir):
+            # A directory can only be renamed over an empty one, so the old snapshot is moved aside first.
+            old_dir = tempfile.mkdtemp(prefix=prefix, suffix='.old', dir=parent_dir)
+            with contextlib.suppress(FileNotFoundError):
+                os.replace(snapshot_dir, old_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        # If another writer has put its snapshot in place meanwhile, it was built from the same sources and is kept.
+        with contextlib.suppress(OSError):
+            os.replace(tmp_dir, snapshot_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# In[52]:
+
+
+def read_snapshot(snapshot_dir:str, sources:list=None):
+    '''Loads a columnar snapshot, memory-mapping the numeric columns (copy-on-write) rather than reading them into memory.
+
+    Parameters
+    ----------
+    snapshot_dir: string
+        Directory the snapshot was written to.
+
+    sources (optional): list
+        Paths of the source files. If given and they have changed since the snapshot was written,
+        the snapshot is treated as missing.
+
+    Returns
+    -------
+    tuple
+        Dictionary of frame name to DataFrame and dictionary of stored lookups,
+        or None if there is no usable snapshot.
+    '''
+    manifest_path = os.path.join(snapshot_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return(None)
+
+    with open(manifest_path, 'r') as json_file:
+        manifest = json.load(json_file)
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        return(None)
+    if sources is not None and manifest['sources'] != source_signature(sources):
+        return(None)
+
+    frames = {}
+    for frame_name, columns in manifest['frames'].items():
+        data = {}
+        for column in columns:
+            values = np.load(os.path.join(snapshot_dir, column['file']), mmap_mode='c')
+            if column['dtype'] == 'category':
+                data[column['name']] = pd.Categorical.from_codes(values, column['categories'])
+            elif 'categories' in column:
+                data[column['name']] = pd.Series(np.asarray(column['categories'], dtype=object)[values]).astype(column['dtype'])
+            else:
+                data[column['name']] = values
+        frames[frame_name] = pd.DataFrame(data, copy=False)
+
+    return(frames, manifest['lookups'])
+
+
+# In[53]:
+
+
+def load_dataset(snapshot_dir:str='pl_snapshot', gameweek_path:str='players_1920_fin.csv', names_path:str='player_idlist.csv'):
+    '''Loads the gameweek table and its derived lookups, from the snapshot if it is up to date and from the CSVs otherwise.
+
+    After a CSV load the snapshot is (re)written, so the next start can skip the CSV parse.
+
+    Parameters
+    ----------
+    snapshot_dir (optional): string
+        Directory of the columnar snapshot.
+
+    gameweek_path (optional): string
+        Path to the gameweek-level CSV file.
+
+    names_path (optional): string
+        Path to the player id/name CSV file.
+
+    Returns
+    -------
+    tuple
+        new_sample_data, radar_df, labels_dict and team_dict.
+    '''
+    sources = [gameweek_path, names_path]
+    snapshot = read_snapshot(snapshot_dir, sources)
+    if snapshot is not None:
+        frames, lookups = snapshot
+        return(frames['new_sample_data'], frames['radar_df'], lookups['labels_dict'], lookups['team_dict'])
+
+    new_sample_data, radar_df, labels_dict, team_dict = load_csv_data(gameweek_path, names_path)
+    write_snapshot(snapshot_dir, {'new_sample_data':new_sample_data, 'radar_df':radar_df},
+                   {'labels_dict':labels_dict, 'team_dict':team_dict}, sources)
+    return(new_sample_data, radar_df, labels_dict, team_dict)
+
+
+# In[54]:
+
+
+class SeasonStore:
+    '''Loads past seasons on demand and keeps the most recently used ones in memory.
+
+    Each season is its own partition: its gameweek table (from its own snapshot, see load_dataset), a
+    MemoryBackend over it and a NameIndex of that season's player ids. Partitions are only loaded when a
+    chart asks for that season, and at most max_loaded are kept; the least recently used is dropped first.
+    The current season is not held here: it is the one loaded at startup (see season_context).
+
+    Parameters
+    ----------
+    seasons (optional): dict
+        Dictionary of season to its file paths, laid out like SEASONS.
+
+    max_loaded (optional): int
+        Maximum number of seasons kept in memory.
+
+    snapshot_prefix (optional): string
+        Prefix of each season's snapshot directory (the season is appended).
+    '''
+    def __init__(self, seasons:dict=None, max_loaded:int=3, snapshot_prefix:str='pl_snapshot_'):
+        self.seasons = SEASONS if seasons is None else seasons
+        self.max_loaded = max_loaded
+        self.snapshot_prefix = snapshot_prefix
+        self.partitions = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits':0, 'loads':0, 'evictions':0}
+
+    def get(self, season:str):
+        '''Returns a season's (backend, name index), loading the season if it is not in memory.'''
+        if season not in self.seasons:
+            raise KeyError(f'Unknown season: {season}')
+        with self.lock:
+            if season in self.partitions:
+                self.partitions.move_to_end(season)
+                self.stats['hits'] += 1
+                return(self.partitions[season])
+
+            paths = self.seasons[season]
+            with metrics.span('season.load'):
+                data, radar, _, _ = load_dataset(self.snapshot_prefix + season, paths['gameweek_path'], paths['names_path'])
+                partition = (MemoryBackend(*build_player_index(data), radar), NameIndex(pd.read_csv(paths['names_path'])))
+            self.partitions[season] = partition
+            self.stats['loads'] += 1
+            while len(self.partitions) > self.max_loaded:
+                self.partitions.popitem(last=False)
+                self.stats['evictions'] += 1
+            return(partition)
+
+
+# In[55]:
+
+
+def season_context(season:str=None):
+    '''Returns the (backend, name index) that chart functions read a season from.
+
+    The current season uses the dataset loaded at startup; any other season comes from season_store.
+
+    Parameters
+    ----------
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    tuple
+        The season's backend and NameIndex.
+    '''
+    context.require('names', 'data')
+    if season is None or season == CURRENT_SEASON:
+        return(backend, name_index)
+    return(season_store.get(season))
+
+
+# In[56]:
+
+
+def season_range(first:str, last:str):
+    '''Returns the registered seasons from first to last inclusive, oldest first (e.g. for line_ind).'''
+    seasons = list(SEASONS)
+    return(seasons[seasons.index(first):seasons.index(last) + 1])
+
+
+# In[57]:
+
+
+class SimilarityIndex:
+    '''A normalized player x metric matrix for finding the players most similar to a given one.
+
+    Each metric is min-max scaled to [0, 1] across the players, so no metric dominates by its units.
+    The matrix is built once; a query scores every player in one vectorized pass and partially sorts
+    (argpartition) only the k best, so its cost stays linear in the number of players.
+
+    Parameters
+    ----------
+    season_df: DataFrame
+        Season-long table(s) laid out like season_aggregates, optionally with a season column
+        (for several seasons stacked together).
+
+    metric_names (optional): list
+        The metrics to include. Defaults to every gameweek metric in the table.
+    '''
+    def __init__(self, season_df:pd.DataFrame, metric_names:list=None):
+        self.metrics = [metric for metric in GAMEWEEK_METRICS if metric in season_df.columns] if metric_names is None else list(metric_names)
+        self.positions = {metric:i for i, metric in enumerate(self.metrics)}
+        values = season_df[self.metrics].to_numpy(dtype=np.float64)
+        low, high = values.min(axis=0), values.max(axis=0)
+        self.matrix = np.ascontiguousarray((values - low) / np.where(high > low, high - low, 1.0))
+        self.ids = season_df['id'].to_numpy()
+        self.names = season_df['name'].to_numpy()
+        self.seasons = season_df['season'].to_numpy() if 'season' in season_df.columns else np.full(len(season_df), None)
+        self.rows = {(season, int(player_id)):row for row, (season, player_id) in enumerate(zip(self.seasons, self.ids))}
+
+    def similar(self, row:int, metric_names:list=None, k:int=5, method:str='cosine'):
+        '''Returns the k players most similar to the player in the given matrix row.
+
+        Parameters
+        ----------
+        row: int
+            The player's row in the matrix (see rows).
+
+        metric_names (optional): list
+            The metrics compared. Defaults to all of them.
+
+        k (optional): int
+            Number of players returned.
+
+        method (optional): string
+            'cosine' (similarity of the metric profile's shape, 1 is identical) or
+            'euclidean' (distance between the scaled values, 0 is identical). Over a single metric every
+            player has the same cosine score, so 'euclidean' (the absolute difference) is used instead.
+
+        Returns
+        -------
+        DataFrame
+            id, name, season and score of the k most similar players, most similar first.
+        '''
+        matrix = self.matrix if metric_names is None else self.matrix[:, [self.positions[metric] for metric in metric_names]]
+        target = matrix[row]
+        if method == 'cosine' and matrix.shape[1] < 2:
+            method = 'euclidean'
+        if method == 'cosine':
+            norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+            scores = matrix @ target / np.maximum(norms * norms[row], 1e-12)
+            distances = -scores
+        elif method == 'euclidean':
+            diff = matrix - target
+            scores = distances = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        else:
+            raise ValueError(f'Unknown similarity method: {method}')
+        distances[row] = np.inf
+
+        k = min(k, len(matrix) - 1)
+        top = np.argpartition(distances, k - 1)[:k] if k > 0 else np.empty(0, dtype=np.int64)
+        top = top[np.argsort(distances[top], kind='stable')]
+        return(pd.DataFrame({'id':self.ids[top], 'name':self.names[top], 'season':self.seasons[top], 'score':scores[top]}))
+
+
+# In[58]:
+
+
+def similar_players(player_name:str, metric_list:list=None, k:int=5, method:str='cosine', season:str=None, pool:list=None):
+    '''Returns the players most similar to the given one over a chosen set of metrics.
+
+    The similarity index of each season (or pool of seasons) is built on first use and rebuilt
+    only when that season's data changes.
+
+    Parameters
+    ----------
+    player_name: string
+        The name of the player being searched for.
+
+    metric_list (optional): list
+        The metrics compared. Defaults to every gameweek metric.
+
+    k (optional): int
+        Number of players returned.
+
+    method (optional): string
+        'cosine' or 'euclidean' (see SimilarityIndex.similar).
+
+    season (optional): string
+        The player's season. Defaults to CURRENT_SEASON.
+
+    pool (optional): list
+        Seasons to search for similar players. Defaults to the player's season only.
+
+    Returns
+    -------
+    DataFrame
+        id, name, season and score of the k most similar players, most similar first.
+    '''
+    season = CURRENT_SEASON if season is None else season
+    pool = tuple([season] if pool is None else pool)
+    contexts = [season_context(one_season) for one_season in pool]
+    token = [(id(season_backend), season_backend.version) for season_backend, _ in contexts]
+
+    cached = similarity_indexes.get(pool)
+    if cached is None or cached[0] != token:
+        with metrics.span('similarity.build'):
+            tables = [season_backend.season_table().assign(season=one_season)
+                      for one_season, (season_backend, _) in zip(pool, contexts)]
+            cached = similarity_indexes[pool] = (token, SimilarityIndex(pd.concat(tables, ignore_index=True)))
+    index = cached[1]
+
+    player_id = season_context(season)[1].resolve(player_name)
+    if (season, player_id) not in index.rows:
+        raise KeyError(f'{player_name} did not play in {season}')
+    with metrics.span('similarity.query'):
+        return(index.similar(index.rows[(season, player_id)], metric_list, k, method))
+
+
+# In[59]:
+
+
+class Leaderboard:
+    '''Ranks players by any metric, over any range of gameweeks and optionally within one team.
+
+    Built once from the gameweek rows. Each (player, team) pair gets a running total of every metric over
+    the rounds (a prefix sum), so a range total is one subtraction per pair whatever the range. Full-season
+    rankings are sorted once up front, overall and per team, so they are answered by slicing.
+
+    Parameters
+    ----------
+    rows: DataFrame
+        Gameweek rows with id, team, round and metric columns.
+
+    names: dict
+        Dictionary of player id to full name.
+
+    mean_metrics (optional): tuple
+        The metrics averaged (rather than summed) over the range.
+    '''
+    def __init__(self, rows:pd.DataFrame, names:dict, mean_metrics:tuple=MEAN_METRICS):
+        self.metrics = [metric for metric in GAMEWEEK_METRICS if metric in rows.columns]
+        self.positions = {metric:i for i, metric in enumerate(self.metrics)}
+        self.mean_metrics = mean_metrics
+        self.integer_metrics = {metric for metric in self.metrics if rows[metric].dtype.kind in 'iu' and metric not in mean_metrics}
+        self.last_round = int(rows['round'].max())
+
+        pair_codes, pairs = pd.factorize(pd.MultiIndex.from_arrays([rows['id'], rows['team']]))
+        self.player_ids, player_codes = np.unique(pairs.get_level_values(0).to_numpy(), return_inverse=True)
+        self.pair_player = player_codes
+        self.pair_team = pairs.get_level_values(1).to_numpy()
+        self.names = np.array([names.get(int(player_id), str(player_id)) for player_id in self.player_ids], dtype=object)
+
+        # totals[pair, r, metric] is the pair's running total up to and including round r (round 0 is all zeros).
+        rounds = rows['round'].to_numpy()
+        per_round = np.zeros((len(pairs), self.last_round + 1, len(self.metrics)))
+        np.add.at(per_round, (pair_codes, rounds), rows[self.metrics].to_numpy(dtype=np.float64))
+        games = np.zeros((len(pairs), self.last_round + 1))
+        np.add.at(games, (pair_codes, rounds), 1)
+        self.totals = per_round.cumsum(axis=1)
+        self.games = games.cumsum(axis=1)
+
+        latest = rows.sort_values('round', kind='stable').drop_duplicates('id', keep='last').set_index('id')['team']
+        self.current_team = latest.reindex(self.player_ids).to_numpy()
+
+        self.season_values = {team:self._values(1, self.last_round, team) for team in [None] + sorted(set(self.pair_team))}
+        self.season_orders = {key:np.argsort(-values, axis=0, kind='stable') for key, (values, _, _) in self.season_values.items()}
+
+    def _values(self, first_week:int, last_week:int, team:str=None):
+        # Range totals per pair, then per player (or per pair, for one team).
+        totals = self.totals[:, last_week] - self.totals[:, first_week - 1]
+        games = self.games[:, last_week] - self.games[:, first_week - 1]
+        if team is None:
+            player_totals = np.zeros((len(self.player_ids), len(self.metrics)))
+            np.add.at(player_totals, self.pair_player, totals)
+            totals = player_totals
+            games = np.bincount(self.pair_player, weights=games, minlength=len(self.player_ids))
+            players = np.arange(len(self.player_ids))
+        else:
+            keep = np.flatnonzero(self.pair_team == team)
+            totals, games, players = totals[keep], games[keep], self.pair_player[keep]
+        means = np.divide(totals, games[:, None], out=np.zeros_like(totals), where=games[:, None] > 0)
+        values = np.where(np.isin(self.metrics, self.mean_metrics)[None, :], means, totals)
+        # Players without a game in the range are ranked last.
+        values[games == 0] = -np.inf
+        return(values, games, players)
+
+    def top(self, metric:str, n:int=20, first_week:int=None, last_week:int=None, team:str=None):
+        '''Returns the top n players by a metric over a gameweek range.
+
+        Parameters
+        ----------
+        metric: string
+            The metric, by name or by its label in labels_dict_inv.
+
+        n (optional): int
+            Number of players returned.
+
+        first_week (optional): int
+            First gameweek of the range (inclusive). Defaults to the first.
+
+        last_week (optional): int
+            Last gameweek of the range (inclusive). Defaults to the last.
+
+        team (optional): string
+            Only count games played for this team.
+
+        Returns
+        -------
+        DataFrame
+            rank, name, team, gameweeks played in the range and the metric's total (or average, for averaged metrics).
+        '''
+        metric = labels_dict_inv.get(metric, metric)
+        column = self.positions[metric]
+        first_week = 1 if first_week is None else max(int(first_week), 1)
+        last_week = self.last_round if last_week is None else min(int(last_week), self.last_round)
+        if first_week > last_week:
+            raise ValueError(f'Empty gameweek range: {first_week} to {last_week}')
+        if team is not None and team not in self.season_values:
+            raise KeyError(f'Unknown team: {team}')
+
+        if first_week == 1 and last_week == self.last_round:
+            values, games, players = self.season_values[team]
+            order = self.season_orders[team][:, column]
+            top = order[:n][np.isfinite(values[order[:n], column])]
+        else:
+            values, games, players = self._values(first_week, last_week, team)
+            scores = values[:, column]
+            n = min(n, len(scores))
+            top = np.argpartition(-scores, n - 1)[:n] if n > 0 else np.empty(0, dtype=np.int64)
+            top = top[np.lexsort((top, -scores[top]))]
+            top = top[np.isfinite(scores[top])]
+
+        scores = values[top, column]
+        return(pd.DataFrame({'rank':np.arange(1, len(top) + 1), 'name':self.names[players[top]],
+                             'team':team if team is not None else self.current_team[players[top]],
+                             'gameweeks':games[top].astype(np.int64),
+                             metric:scores.astype(np.int64) if metric in self.integer_metrics else scores}))
+
+
+# In[60]:
+
+
+def leaderboard(metric:str, n:int=20, first_week:int=None, last_week:int=None, team:str=None, season:str=None):
+    '''Returns the top n players by a metric, optionally over a gameweek range and within one team.
+
+    The season's Leaderboard is built on first use and rebuilt only when that season's data changes.
+    See Leaderboard.top for the parameters.
+
+    Parameters
+    ----------
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    DataFrame
+        rank, name, team, gameweeks and the metric's value.
+    '''
+    season = CURRENT_SEASON if season is None else season
+    season_backend, season_names = season_context(season)
+    token = (id(season_backend), season_backend.version)
+
+    cached = leaderboards.get(season)
+    if cached is None or cached[0] != token:
+        with metrics.span('leaderboard.build'):
+            rows = season_backend.gameweek_rows(['id', 'team', 'round'] + GAMEWEEK_METRICS)
+            cached = leaderboards[season] = (token, Leaderboard(rows, season_names.names))
+    with metrics.span('leaderboard.query'):
+        return(cached[1].top(metric, n, first_week, last_week, team))
+
+
+# In[61]:
+
+
+class TeamCube:
+    '''A dense team x round x metric array of team totals, for team-level snapshots and charts.
+
+    cube[team, round, metric] is the sum of the metric over the team's gameweek rows in that round;
+    averaged metrics are reported per row (so 'value' is the team's average player price). New rows,
+    rounds and teams are folded in with add, without rebuilding.
+
+    Parameters
+    ----------
+    rows: DataFrame
+        Gameweek rows with team, round and metric columns.
+
+    mean_metrics (optional): tuple
+        The metrics averaged (rather than summed) over a team's rows.
+    '''
+    def __init__(self, rows:pd.DataFrame, mean_metrics:tuple=MEAN_METRICS):
+        self.metrics = [metric for metric in GAMEWEEK_METRICS if metric in rows.columns]
+        self.positions = {metric:i for i, metric in enumerate(self.metrics)}
+        self.mean_metrics = mean_metrics
+        self.teams = []
+        self.team_positions = {}
+        self.cube = np.zeros((0, 1, len(self.metrics)))
+        self.counts = np.zeros((0, 1))
+        self.add(rows)
+
+    def add(self, rows:pd.DataFrame):
+        '''Folds more gameweek rows into the cube.'''
+        for team in sorted(set(rows['team'].astype(str).tolist()) - set(self.team_positions)):
+            self.team_positions[team] = len(self.teams)
+            self.teams.append(team)
+        rounds = rows['round'].to_numpy().astype(np.int64)
+        shape = (len(self.teams), max(self.cube.shape[1], int(rounds.max()) + 1 if len(rounds) else 1))
+        if shape != self.cube.shape[:2]:
+            cube, counts = np.zeros(shape + (len(self.metrics),)), np.zeros(shape)
+            cube[:self.cube.shape[0], :self.cube.shape[1]] = self.cube
+            counts[:self.counts.shape[0], :self.counts.shape[1]] = self.counts
+            self.cube, self.counts = cube, counts
+
+        team_codes = pd.Categorical(rows['team'].astype(str), categories=self.teams).codes.astype(np.int64)
+        np.add.at(self.cube, (team_codes, rounds), rows[self.metrics].to_numpy(dtype=np.float64))
+        np.add.at(self.counts, (team_codes, rounds), 1)
+
+    def _team(self, team:str):
+        if team not in self.team_positions:
+            raise KeyError(f'Unknown team: {team}')
+        return(self.team_positions[team])
+
+    def _report(self, sums:np.ndarray, counts:np.ndarray, metric_names:list):
+        # Sums for summed metrics, per-row averages for averaged ones (NaN where the team has no rows).
+        columns = [self.positions[metric] for metric in metric_names]
+        sums = sums[..., columns]
+        means = np.divide(sums, counts[..., None], out=np.full_like(sums, np.nan), where=counts[..., None] > 0)
+        return(np.where(np.isin(metric_names, self.mean_metrics), means, sums))
+
+    def snapshot(self, team:str, week:int, metric_names:list=None):
+        '''Returns a team's totals (averages, for averaged metrics) for one gameweek.'''
+        metric_names = self.metrics if metric_names is None else list(metric_names)
+        t = self._team(team)
+        if week >= self.cube.shape[1]:
+            return(pd.Series(np.nan, index=metric_names))
+        return(pd.Series(self._report(self.cube[t, week], self.counts[t, week], metric_names), index=metric_names))
+
+    def trend(self, team:str, metric:str):
+        '''Returns a team's value of one metric in every round it has rows for, indexed by round.'''
+        t = self._team(team)
+        values = self._report(self.cube[t], self.counts[t], [metric])[:, 0]
+        played = self.counts[t] > 0
+        return(pd.Series(values[played], index=pd.Index(np.flatnonzero(played), name='round'), name=metric))
+
+    def season(self, team:str, metric_names:list=None):
+        '''Returns a team's season totals (averages, for averaged metrics).'''
+        metric_names = self.metrics if metric_names is None else list(metric_names)
+        t = self._team(team)
+        return(pd.Series(self._report(self.cube[t].sum(axis=0), self.counts[t].sum(), metric_names), index=metric_names))
+
+
+# In[62]:
+
+
+def team_cube(season:str=None):
+    '''Returns the season's TeamCube, building it on first use and again only if that season's data changes.
+
+    Parameters
+    ----------
+    season (optional): string
+        The season, e.g. '2019-20'. Defaults to CURRENT_SEASON.
+
+    Returns
+    -------
+    TeamCube
+        The season's team x round x metric cube.
+    '''
+    season = CURRENT_SEASON if season is None else season
+    season_backend, _ = season_context(season)
+    token = (id(season_backend), season_backend.version)
+    cached = team_cubes.get(season)
+    if cached is None or cached[0] != token:
+        with metrics.span('team_cube.build'):
+            cached = team_cubes[season] = (token, TeamCube(season_backend.gameweek_rows(['team', 'round'] + GAMEWEEK_METRICS)))
+    return(cached[1])
+
+
+# In[63]:
+
+
+def load_database(data:pd.DataFrame, db_path:str='pl.sqlite'):
+    '''Writes the full gameweek table and the player names to the SQLite database.
+
+    Rows are upserted, so re-running the load updates the database in place instead of rebuilding it.
+    Everything is inserted with executemany inside a single transaction.
+
+    Parameters
+    ----------
+    data: DataFrame
+        Gameweek-level data, laid out like new_sample_data.
+
+    db_path (optional): string
+        Path to the SQLite database.
+
+    Returns
+    -------
+    dict
+        Number of gameweek and player rows written, time taken and rows/sec throughput.
+    '''
+    data = widen_frame(data)
+    metric_names = list(data.columns[6:])
+    sql_types = {metric:('INT' if data[metric].dtype.kind in 'iu' else 'REAL') for metric in metric_names}
+
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute('PRAGMA journal_mode=WAL')
+    cur.execute('PRAGMA synchronous=NORMAL')
+
+    if cur.execute('PRAGMA user_version').fetchone()[0] == 0:
+        # Replaces the five-row sample schema of earlier versions.
+        cur.execute('DROP TABLE IF EXISTS "player_data"')
+        cur.execute('DROP TABLE IF EXISTS "player_name"')
+        cur.execute('''
+            CREATE TABLE "player_name" (
+                id INT NOT NULL PRIMARY KEY UNIQUE,
+                first_name TEXT NOT NULL,
+                last_name TEXT NOT NULL
+        );''')
+        metric_columns = ''.join(f'{metric} {sql_types[metric]} NOT NULL,\n                ' for metric in metric_names)
+        cur.execute(f'''
+            CREATE TABLE "player_data" (
+                id INTEGER PRIMARY KEY,
+                player_id INT NOT NULL,
+                round INT NOT NULL,
+                team TEXT NOT NULL,
+                opponent_team TEXT NOT NULL,
+                {metric_columns}FOREIGN KEY (player_id) REFERENCES player_name(id)
+        );''')
+        # A player can play twice in one round, so the opponent completes the key.
+        cur.execute('CREATE UNIQUE INDEX "player_data_player_round" ON "player_data" (player_id, round, opponent_team)')
+        cur.execute('CREATE INDEX "player_data_team_round" ON "player_data" (team, round)')
+        cur.execute('PRAGMA user_version = 1')
+        conn.commit()
+
+    insert_player_name = '''
+        INSERT INTO player_name(id, first_name, last_name) VALUES (?,?,?)
+        ON CONFLICT(id) DO UPDATE SET first_name=excluded.first_name, last_name=excluded.last_name
+    '''
+    columns = ['id', 'round', 'team', 'opponent_team'] + metric_names
+    insert_player_data = f'''
+        INSERT INTO player_data(player_id, round, team, opponent_team, {', '.join(metric_names)})
+        VALUES ({','.join('?' * len(columns))})
+        ON CONFLICT(player_id, round, opponent_team) DO UPDATE SET
+            team=excluded.team, {', '.join(f'{metric}=excluded.{metric}' for metric in metric_names)}
+    '''
+
+    players = data.drop_duplicates(subset='id')
+    start = time.perf_counter()
+    with conn:
+        cur.executemany(insert_player_name, zip(players['id'].tolist(), players['first_name'].tolist(),
+                                                players['second_name'].tolist()))
+        cur.executemany(insert_player_data, zip(*[data[col].tolist() for col in columns]))
+    seconds = time.perf_counter() - start
+    conn.close()
+
+    return({'gameweek_rows':len(data), 'player_rows':len(players), 'seconds':seconds,
+            'rows_per_sec':(len(data) + len(players)) / seconds})
+
+
+# In[64]:
+
+
+def database_ready(db_path:str='pl.sqlite'):
+    '''Returns whether db_path holds a database written by load_database, rather than nothing or the old five-row sample schema.'''
+    if not os.path.exists(db_path):
+        return(False)
+    conn = sqlite3.connect(db_path)
+    try:
+        return(conn.execute('PRAGMA user_version').fetchone()[0] >= 1)
+    finally:
+        conn.close()
+
+
+# In[65]:
+
+
+class SqliteBackend:
+    '''Serves chart data straight from pl.sqlite, reading only the rows and columns each chart needs.
+
+    One connection is kept open and reused; queries are parameterized, so SQLite's statement cache
+    reuses the compiled statements across calls. Season maxima for the radar chart are computed once per data version.
+
+    Parameters
+    ----------
+    db_path (optional): string
+        Path to a database written by load_database.
+
+    mean_metrics (optional): tuple
+        The metrics averaged (rather than summed) across the season.
+    '''
+    def __init__(self, db_path:str='pl.sqlite', mean_metrics:tuple=MEAN_METRICS):
+        self.mean_metrics = mean_metrics
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=256)
+        self.columns = [row[1] for row in self.conn.execute('PRAGMA table_info(player_data)')]
+        self.metrics = self.columns[self.columns.index('opponent_team') + 1:]
+        self.maxima, self.maxima_version = None, None
+
+    @property
+    def version(self):
+        '''Changes whenever another connection commits to the database.'''
+        with self.lock:
+            return(self.conn.execute('PRAGMA data_version').fetchone()[0])
+
+    @property
+    def teams(self):
+        '''The set of teams in the database.'''
+        with self.lock:
+            return({row[0] for row in self.conn.execute('SELECT DISTINCT team FROM player_data')})
+
+    def _select(self, columns:list):
+        columns = list(dict.fromkeys(columns))
+        expressions = []
+        for col in columns:
+            if col == 'first_name':
+                expressions.append('n.first_name')
+            elif col == 'second_name':
+                expressions.append('n.last_name AS second_name')
+            elif col == 'id':
+                expressions.append('d.player_id AS id')
+            elif col in self.columns:
+                expressions.append(f'd.{col}')
+            else:
+                raise KeyError(col)
+        join = ' JOIN player_name n ON n.id=d.player_id' if {'first_name', 'second_name'} & set(columns) else ''
+        return(columns, f'SELECT {", ".join(expressions)} FROM player_data d{join}')
+
+    def _query(self, columns:list, sql:str, params:list):
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return(pd.DataFrame(rows, columns=columns))
+
+    @property
+    def rounds(self):
+        '''The set of gameweeks loaded.'''
+        with self.lock:
+            return({row[0] for row in self.conn.execute('SELECT DISTINCT round FROM player_data')})
+
+    def player_rows(self, player_id:int, columns:list):
+        '''Returns the given columns of a player's gameweek rows, ordered by round (empty if the player is not found).'''
+        columns, sql = self._select(columns)
+        if player_id is None:
+            return(pd.DataFrame(columns=columns))
+        return(self._query(columns, sql + ' WHERE d.player_id=? ORDER BY d.round, d.id', [int(player_id)]))
+
+    def team_week_rows(self, team:str, week:int, columns:list):
+        '''Returns the given columns of a team's rows for one gameweek, ordered by player.'''
+        columns, sql = self._select(columns)
+        return(self._query(columns, sql + ' WHERE d.team=? AND d.round=? ORDER BY d.player_id, d.id', [team, int(week)]))
+
+    def players_rows(self, player_ids:list, columns:list):
+        '''Returns the given columns of several players' gameweek rows, selected in one query and ordered by player and round.'''
+        columns, sql = self._select(columns)
+        ids = [int(player_id) for player_id in player_ids if player_id is not None]
+        return(self._query(columns, sql + f' WHERE d.player_id IN ({",".join("?" * len(ids))})'
+                                          ' ORDER BY d.player_id, d.round, d.id', ids))
+
+    def _aggregates(self, metric_names:list):
+        for metric in metric_names:
+            if metric not in self.metrics:
+                raise KeyError(metric)
+        return([f'{"AVG" if metric in self.mean_metrics else "SUM"}({metric})' for metric in metric_names])
+
+    def season_rows(self, player_ids:list, metric_names:list):
+        '''Returns the season-long values of the given metrics, one row per player in the order given.'''
+        metric_names = list(dict.fromkeys(metric_names))
+        ids = [int(player_id) for player_id in player_ids]
+        sql = f'''SELECT player_id, {", ".join(self._aggregates(metric_names))} FROM player_data
+                  WHERE player_id IN ({",".join("?" * len(ids))}) GROUP BY player_id'''
+        with self.lock:
+            rows = {row[0]:row[1:] for row in self.conn.execute(sql, ids)}
+        return(pd.DataFrame([rows[player_id] for player_id in ids], columns=metric_names))
+
+    def gameweek_rows(self, columns:list):
+        '''Returns the given columns of every gameweek row, ordered by player and round.'''
+        columns, sql = self._select(columns)
+        return(self._query(columns, sql + ' ORDER BY d.player_id, d.round, d.id', []))
+
+    def season_table(self):
+        '''Returns the season-long table of every player, laid out like season_aggregates.'''
+        sql = f'''SELECT d.player_id, n.first_name || ' ' || n.last_name, {", ".join(self._aggregates(self.metrics))}
+                  FROM player_data d JOIN player_name n ON n.id=d.player_id GROUP BY d.player_id ORDER BY d.player_id'''
+        return(self._query(['id', 'name'] + self.metrics, sql, []))
+
+    def metric_max(self, metric_names:list):
+        '''Returns the largest season-long value of each metric across all players.'''
+        version = self.version
+        if self.maxima is None or self.maxima_version != version:
+            sql = f'''SELECT {", ".join(f"MAX(v{i})" for i in range(len(self.metrics)))} FROM
+                      (SELECT {", ".join(f"{agg} AS v{i}" for i, agg in enumerate(self._aggregates(self.metrics)))}
+                       FROM player_data GROUP BY player_id)'''
+            with self.lock:
+                self.maxima = pd.Series(self.conn.execute(sql).fetchone(), index=self.metrics)
+            self.maxima_version = version
+        return(self.maxima[list(dict.fromkeys(metric_names))])
+
+
+# In[66]:
+
+
+def gameweek_data():
+    '''Returns the whole gameweek table: new_sample_data with the rows of any ingested gameweeks appended.
+
+    The ingested rows are joined on first use after an ingest, and the result replaces new_sample_data.
+
+    Returns
+    -------
+    DataFrame
+        The gameweek table in the compact schema, or None if the sqlite backend has released it.
+    '''
+    global new_sample_data, ingested_parts
+    context.require('data')
+    if ingested_parts:
+        parts = [new_sample_data] + ingested_parts
+        new_sample_data = pd.concat(parts, ignore_index=True)
+        for col in CATEGORY_COLUMNS:
+            new_sample_data[col] = pd.api.types.union_categoricals([part[col] for part in parts], sort_categories=True)
+        ingested_parts = []
+    return(new_sample_data)
+
+
+# In[67]:
+
+
+def ingest_gameweek(gameweek_path:str, names_path:str='player_idlist.csv', db_path:str='pl.sqlite'):
+    '''Adds one new gameweek file to the loaded season without rebuilding anything.
+
+    The rows are appended to the backend, radar_df is updated with running sums and means, the team cube has
+    the rows added, only the new rows are upserted into the database, and any new team is added to team_dict.
+    The backend's data version changes, so cached figures are rebuilt. Rounds that are already loaded are
+    rejected. The rows are kept apart from new_sample_data until gameweek_data needs the whole table, so the
+    cost of an ingest depends only on the size of the new file.
+
+    The loaded data is updated before the database: if the database write fails, its transaction is rolled
+    back and only the database is missing the round (load_database can be run again).
+
+    The season CSV and its snapshot are not touched: append the file to the season CSV to keep the round
+    on the next full load.
+
+    Parameters
+    ----------
+    gameweek_path: string
+        Path to a CSV file with the new round's rows, in the format of players_1920_fin.csv.
+
+    names_path (optional): string
+        Path to the player id/name CSV file (it must include any new players).
+
+    db_path (optional): string
+        Path to the SQLite database.
+
+    Returns
+    -------
+    dict
+        Rounds and number of rows added, new players and teams, and time taken.
+    '''
+    global radar_df
+    context.require('names', 'data', 'database')
+    start = time.perf_counter()
+    with metrics.span('ingest.read'):
+        delta = read_gameweeks(gameweek_path, pd.read_csv(names_path))
+    rounds = sorted(set(delta['round'].tolist()))
+    overlap = backend.rounds.intersection(rounds)
+    if overlap:
+        raise ValueError(f'Gameweek(s) already loaded: {sorted(overlap)}')
+
+    new_players = [(int(player_id), f_name, s_name) for player_id, f_name, s_name
+                   in delta[['id', 'first_name', 'second_name']].drop_duplicates('id').itertuples(index=False)
+                   if player_id not in name_index.names]
+    for player_id, f_name, s_name in new_players:
+        name_index.add(player_id, f_name, s_name)
+
+    new_teams = sorted(set(delta['team'].tolist()) - set(team_dict.values()))
+    for team in new_teams:
+        team_dict[str(len(team_dict) + 1)] = team
+
+    cached_cube = team_cubes.get(CURRENT_SEASON)
+    if isinstance(backend, MemoryBackend):
+        with metrics.span('ingest.memory'):
+            backend.append(delta)
+            radar_df = backend.radar_df
+            ingested_parts.append(compact_frame(delta))
+    with metrics.span('ingest.database'):
+        load_database(delta, db_path)
+
+    if cached_cube is not None:
+        cached_cube[1].add(delta)
+        team_cubes[CURRENT_SEASON] = ((id(backend), backend.version), cached_cube[1])
+
+    return({'rounds':rounds, 'rows':len(delta), 'new_players':[player[0] for player in new_players],
+            'new_teams':new_teams, 'seconds':time.perf_counter() - start})
+
+
+# In[68]:
+
+
+class Context:
+    '''Loads the dataset, its derived tables, the API cache and the database on first use.
+
+    Each stage sets the module globals the functions above read, as the startup cells used to, so importing the
+    module loads nothing until a function needs it. Functions call require for the stages they use:
+
+        names     name_index
+        api       api_cache, api_client
+        data      new_sample_data, radar_df, labels_dict, labels_dict_inv, team_dict, player_data, player_index, backend
+                  (and ingested_parts, see gameweek_data)
+        database  db_stats (db_path rebuilt from the dataset)
+
+    Reading one of those names from the context (e.g. context.radar_df) loads its stage first.
+
+    Parameters
+    ----------
+    data_backend (optional): string
+        'memory' serves charts from the loaded DataFrames; 'sqlite' reads them from db_path on demand
+        and releases the in-memory tables once the database is loaded. With rebuild_database=False and an
+        up-to-date db_path, the sqlite backend does not load the dataset at all: the labels and teams are
+        read from the database and the DataFrame globals are None.
+
+    db_path (optional): string
+        Path to the SQLite database.
+
+    rebuild_database (optional): bool
+        Whether the database stage rebuilds db_path from the dataset, or uses the file as it is
+        (it is still built if it is missing or has the old sample schema).
+
+    shared (optional): string or dict
+        A SharedDataset manifest (or the path to its file). The data stage then maps the published tables
+        read-only instead of loading the dataset; new_sample_data is the same table as player_data.
+    '''
+    GLOBALS = {'name_index':'names', 'api_cache':'api', 'api_client':'api', 'new_sample_data':'data',
+               'radar_df':'data', 'labels_dict':'data', 'labels_dict_inv':'data', 'team_dict':'data',
+               'player_data':'data', 'player_index':'data', 'backend':'data', 'db_stats':'database'}
+
+    def __init__(self, data_backend:str='memory', db_path:str='pl.sqlite', rebuild_database:bool=True, shared=None):
+        self.data_backend = data_backend
+        self.db_path = db_path
+        self.rebuild_database = rebuild_database
+        self.shared = shared
+        self.loaded = set()
+        # Reentrant, as loading one stage can require another.
+        self.lock = threading.RLock()
+
+    def require(self, *stages):
+        '''Loads each of the given stages ('names', 'api', 'data', 'database') that is not loaded yet.
+
+        Safe to call from several threads (e.g. VisualizerService's workers): each stage is loaded once.
+        '''
+        for stage in stages:
+            if stage not in self.loaded:
+                with self.lock:
+                    if stage not in self.loaded:
+                        getattr(self, f'_load_{stage}')()
+                        self.loaded.add(stage)
+
+    def load(self):
+        '''Loads every stage, as running the notebook from the top does.'''
+        self.require('names', 'api', 'data', 'database')
+
+    def __getattr__(self, name:str):
+        if name not in self.GLOBALS:
+            raise AttributeError(name)
+        self.require(self.GLOBALS[name])
+        if name == 'new_sample_data':
+            return(gameweek_data())
+        return(globals()[name])
+
+    def _load_names(self):
+        # Read with the csv module, so that API-only use does not import pandas.
+        global name_index
+        with metrics.span('startup.name_index'):
+            with open(SEASONS[CURRENT_SEASON]['names_path'], newline='', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+            name_index = NameIndex({column:[row[column] for row in rows] for column in ['first_name', 'second_name', 'id']})
+
+    def _load_api(self):
+        global api_cache, api_client
+        api_cache = ApiCache('api_cache.sqlite', legacy_path='api_cache.json')
+        api_client = ApiClient()
+
+    def _load_data(self):
+        global new_sample_data, radar_df, labels_dict, labels_dict_inv, team_dict, player_data, player_index, backend
+        global ingested_parts
+        ingested_parts = []
+        use_database = self.data_backend == 'sqlite' and not self.rebuild_database and database_ready(self.db_path)
+        if use_database:
+            with metrics.span('startup.lookups'):
+                backend = SqliteBackend(self.db_path)
+                labels_dict, team_dict = build_lookups(['id', 'round', 'first_name', 'second_name', 'team',
+                                                        'opponent_team'] + backend.metrics, backend.teams)
+            new_sample_data = radar_df = player_data = player_index = None
+        elif self.shared is not None:
+            with metrics.span('startup.attach_shared'):
+                dataset = SharedDataset.attach(self.shared)
+                player_data, radar_df = dataset.frame('player_data'), dataset.frame('radar_df')
+                lookups = dataset.manifest['lookups']
+            new_sample_data, labels_dict, team_dict = player_data, lookups['labels_dict'], lookups['team_dict']
+            player_index = {int(player_id):slice(start, stop) for player_id, (start, stop) in lookups['player_index'].items()}
+        else:
+            with metrics.span('startup.load_dataset'):
+                new_sample_data, radar_df, labels_dict, team_dict = load_dataset()
+
+        labels_dict_inv = {}
+        for k in labels_dict:
+            labels_dict_inv.update({labels_dict[k]:k})
+        for label in ['Id', 'Round', 'First Name', 'Second Name', 'Team', 'Opponent Team']:
+            del(labels_dict_inv[label])
+
+        if use_database:
+            return
+        if self.shared is None:
+            with metrics.span('startup.player_index'):
+                player_data, player_index = build_player_index(new_sample_data)
+        if self.data_backend == 'sqlite':
+            self._build_database()
+            backend = SqliteBackend(self.db_path)
+            new_sample_data = radar_df = player_data = player_index = None
+        else:
+            backend = MemoryBackend(player_data, player_index, radar_df)
+
+    def _load_database(self):
+        self.require('data')
+        # The sqlite backend built it while loading the data.
+        if self.data_backend != 'sqlite':
+            self._build_database()
+
+    def _build_database(self):
+        global db_stats
+        if self.rebuild_database or not database_ready(self.db_path):
+            with metrics.span('startup.load_database'):
+                db_stats = load_database(new_sample_data, self.db_path)
+            print(f'Loaded {db_stats["gameweek_rows"]} gameweek rows and {db_stats["player_rows"]} players '
+                  f'in {db_stats["seconds"]:.2f}s ({db_stats["rows_per_sec"]:,.0f} rows/sec)')
+
+
+# In[69]:
 
 
-# In[9]:
+class SharedDataset:
+    '''DataFrames laid out in one shared-memory file that other processes map read-only, without copying.
 
+    Numeric columns are stored as they are; categorical and string columns as their dictionary codes, with the
+    dictionaries (and any small lookups) in a JSON manifest alongside. The file is written to /dev/shm where
+    there is one, so every process that maps it shares the same pages. Other processes attach with
+    SharedDataset.attach and the manifest or the path to its file; the publisher removes both with close().
 
-def radar_mul(player_name1:str, player_name2:str, metric_list:list):
-    '''Presents a radar graph for a pair of players for 5 metrics.
-    
     Parameters
     ----------
-    player_name1: string
-        The name of the first player being searched for.
-        
-    player_name2: string
-        The name of the second player being searched for.
-    
-    metric_list: list
-        The list of metrics to be visualized.
+    manifest: dict
+        The layout written by publish.
 
-    Returns
-    -------
-    None
+    manifest_path (optional): string
+        Path to the manifest file, when this process published it.
     '''
-    
-    go.Figure()
-
-    categories = metric_list
-
-    fig = go.Figure()
-
-    fig.add_trace(go.Scatterpolar(
-          r=[(radar_df[radar_df['name']==player_name1][x]*5/radar_df[x].max()).values[0] for x in categories],
-          theta=categories,
-          fill='toself',
-          name=player_name1))
-
-    fig.add_trace(go.Scatterpolar(
-          r=[(radar_df[radar_df['name']==player_name2][x]*5/radar_df[x].max()).values[0] for x in categories],
-          theta=categories,
-          fill='toself',
-          name=player_name2))
+    ALIGN = 64
+
+    def __init__(self, manifest:dict, manifest_path:str=None):
+        self.manifest = manifest
+        self.manifest_path = manifest_path
+        self.mapped = np.memmap(manifest['path'], dtype=np.uint8, mode='r')
+
+    @classmethod
+    def publish(cls, frames:dict, lookups:dict=None, directory:str=None):
+        '''Writes the frames (name to DataFrame with a RangeIndex) and JSON-serializable lookups to shared memory.'''
+        directory = directory or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+        fd, path = tempfile.mkstemp(prefix='pl_shared_', dir=directory)
+        layout, arrays, offset = {}, [], 0
+        for frame_name, frame in frames.items():
+            columns = []
+            for column in frame.columns:
+                values, categories = frame[column], None
+                if not isinstance(values.dtype, pd.CategoricalDtype) and values.dtype.kind not in 'biuf':
+                    values = values.astype('category')
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    categories, values = values.cat.categories.tolist(), values.cat.codes
+                array = values.to_numpy()
+                offset = -(-offset // cls.ALIGN) * cls.ALIGN
+                columns.append({'name':column, 'dtype':array.dtype.str, 'offset':offset, 'categories':categories})
+                arrays.append((offset, array))
+                offset += array.nbytes
+            layout[frame_name] = {'rows':len(frame), 'columns':columns}
+
+        with os.fdopen(fd, 'wb') as data_file:
+            data_file.truncate(max(offset, 1))
+            for array_offset, array in arrays:
+                data_file.seek(array_offset)
+                data_file.write(np.ascontiguousarray(array).tobytes())
+        manifest = {'path':path, 'frames':layout, 'lookups':lookups or {}}
+        with open(path + '.json', 'w') as json_file:
+            json.dump(manifest, json_file)
+        return(cls(manifest, path + '.json'))
+
+    @classmethod
+    def attach(cls, manifest):
+        '''Maps a published dataset, given its manifest or the path to the manifest file.'''
+        if isinstance(manifest, str):
+            with open(manifest, 'r') as json_file:
+                manifest = json.load(json_file)
+        return(cls(manifest))
+
+    def frame(self, name:str):
+        '''Returns a published DataFrame whose columns are read-only views of the shared file.'''
+        layout = self.manifest['frames'][name]
+        columns = {}
+        for column in layout['columns']:
+            dtype = np.dtype(column['dtype'])
+            values = self.mapped[column['offset']:column['offset'] + layout['rows'] * dtype.itemsize].view(dtype)
+            if column['categories'] is not None:
+                values = pd.Categorical.from_codes(values, categories=column['categories'])
+            columns[column['name']] = values
+        return(pd.DataFrame(columns, copy=False))
+
+    def close(self):
+        '''Unmaps the file and, in the publishing process, removes it and its manifest.'''
+        self.mapped._mmap.close()
+        if self.manifest_path is not None:
+            for path in [self.manifest['path'], self.manifest_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+# In[70]:
+
+
+def publish_dataset(directory:str=None):
+    '''Publishes the loaded gameweek table and radar_df to shared memory, for worker processes to attach to.
 
-    fig.update_layout(polar=dict(radialaxis=dict(visible=True,range=[0, 5])),
-                      showlegend=True,
-                      title = f'Radar Plot: {player_name1} vs {player_name2}')
+    Parameters
+    ----------
+    directory (optional): string
+        Directory of the shared file. Defaults to /dev/shm, or the temporary directory.
 
-    fig.show()
+    Returns
+    -------
+    SharedDataset
+        The published dataset. Pass its manifest_path to Context(shared=...) (or init_render_worker) in each
+        worker, and close() it once the workers are done.
+    '''
+    context.require('data')
+    if player_data is None:
+        raise ValueError('publish_dataset needs the memory backend')
+    data, index = (player_data, player_index) if len(backend.segments) == 1 else build_player_index(gameweek_data())
+    lookups = {'player_index':{str(player_id):[rows.start, rows.stop] for player_id, rows in index.items()},
+               'labels_dict':labels_dict, 'team_dict':team_dict}
+    with metrics.span('shared.publish'):
+        return(SharedDataset.publish({'player_data':data, 'radar_df':radar_df}, lookups, directory))
 
 
-# In[10]:
+# In[71]:
 
 
 def select_choice():
@@ -373,7 +3412,7 @@ def select_choice():
     print('\n')
 
 
-# In[11]:
+# In[72]:
 
 
 def select_team():
@@ -393,7 +3432,7 @@ def select_team():
     print('\n')
 
 
-# In[12]:
+# In[73]:
 
 
 def user_interface():
@@ -407,8 +3446,9 @@ def user_interface():
     -------
     None
     '''
+    context.require('names', 'api', 'data')
     while True:
-        ind_vs_mul = input('Welcome to the Premier League 2019/20 stats visualizer! Which stats would you like to see today?\n1) Individual\n2) Multi-Player Comparison\n3) Exit\n\n')
+        ind_vs_mul = input('Welcome to the Premier League 2019/20 stats visualizer! Which stats would you like to see today?\n1) Individual\n2) Multi-Player Comparison\n3) Leaderboard\n4) Exit\n\n')
 
         if ind_vs_mul == 'exit':
             break
@@ -421,7 +3461,11 @@ def user_interface():
                         if int(ind_choice) == 1:
                             p_name = input('Player Name: ')
                             print('\n')
-                            at_a_glance(get_player_api(p_name))
+                            player_dict = get_player_api(p_name)
+                            if player_dict is None:
+                                print('Error: Player not found. Please check the name and try again.')
+                            else:
+                                at_a_glance(player_dict)
                         elif int(ind_choice) == 2:
                             p_name = input('Player Name: ')
                             select_choice()
@@ -441,7 +3485,7 @@ def user_interface():
                         print('Error: Invalid Input. Please re-enter your choice.')
             elif int(ind_vs_mul) == 2:
                 while True:
-                    mul_choice = input('Please choose one of the following:\n1) Season-long Trend (Line, 2 players)\n2) Gameweek Snapshot for a Team (Scatter)\n3) Single/Two-Metric Comparison (Bar, 2 players)\n4) Five-Metric Comparison (Radar, 2 players)\n5) Back\n\n')
+                    mul_choice = input('Please choose one of the following:\n1) Season-long Trend (Line, 2 players)\n2) Gameweek Snapshot for a Team (Scatter)\n3) Single/Two-Metric Comparison (Bar, 2 players)\n4) Five-Metric Comparison (Radar, 2 players)\n5) Season-long Trend for a Team (Line)\n6) Team vs Team (Bar)\n7) At A Glance Comparison (Table)\n8) League-Wide Comparison (Scatter)\n9) Squad Comparison (Line, Bar or Radar, any number of players)\n10) Back\n\n')
 
                     if mul_choice.isnumeric():
                         if int(mul_choice) == 1:
@@ -481,12 +3525,60 @@ def user_interface():
                             metric5 = labels_dict_inv[list(labels_dict_inv.keys())[int(input('Metric 5: '))-1]]
                             radar_mul(p_name1, p_name2, [metric1, metric2, metric3, metric4, metric5])
                         elif int(mul_choice) == 5:
+                            select_team()
+                            t_name = team_dict[input('Team Name: ')]
+                            select_choice()
+                            metric = labels_dict_inv[list(labels_dict_inv.keys())[int(input('Metric: '))-1]]
+                            team_trend(t_name, metric)
+                        elif int(mul_choice) == 6:
+                            select_team()
+                            t_name1 = team_dict[input('Team 1 Name: ')]
+                            t_name2 = team_dict[input('Team 2 Name: ')]
+                            select_choice()
+                            metric_list = [labels_dict_inv[list(labels_dict_inv.keys())[int(choice)-1]]
+                                           for choice in input('Metrics (comma-separated): ').split(',')]
+                            team_vs_team(t_name1, t_name2, metric_list)
+                        elif int(mul_choice) == 7:
+                            p_names = input('Player Names (comma-separated, press Enter/Return for every cached player): ')
+                            position = input('Position (Optional, press Enter/Return to skip): ')
+                            names = [p_name.strip() for p_name in p_names.split(',')] if p_names.strip() else None
+                            print(glance_compare(names, position=position.title() or None).to_string(index=False) + '\n')
+                        elif int(mul_choice) == 8:
+                            select_choice()
+                            metric1 = labels_dict_inv[list(labels_dict_inv.keys())[int(input('Metric 1: '))-1]]
+                            metric2 = labels_dict_inv[list(labels_dict_inv.keys())[int(input('Metric 2: '))-1]]
+                            p_names = input('Players to Highlight (Optional, comma-separated, press Enter/Return to skip): ')
+                            scatter_league(metric1, metric2, [p_name.strip() for p_name in p_names.split(',')] if p_names.strip() else None)
+                        elif int(mul_choice) == 9:
+                            p_names = [p_name.strip() for p_name in input('Player Names (comma-separated): ').split(',')]
+                            style = input('Chart: 1) Line 2) Bar 3) Radar\n')
+                            select_choice()
+                            metric_list = [labels_dict_inv[list(labels_dict_inv.keys())[int(choice)-1]]
+                                           for choice in input('Metrics (comma-separated, one for Line): ').split(',')]
+                            if style == '1':
+                                line_players(p_names, metric_list[0])
+                            elif style == '2':
+                                bar_players(p_names, metric_list)
+                            else:
+                                radar_players(p_names, metric_list)
+                        elif int(mul_choice) == 10:
                             break
                         else:
                             print('Error: Invalid Input. Please re-enter your choice.')
                     else:
                         print('Error: Invalid Input. Please re-enter your choice.')
             elif int(ind_vs_mul) == 3:
+                select_choice()
+                metric = labels_dict_inv[list(labels_dict_inv.keys())[int(input('Metric: '))-1]]
+                first_week = input('From Week (Optional, press Enter/Return for the first): ')
+                last_week = input('To Week (Optional, press Enter/Return for the last): ')
+                select_team()
+                team = input('Team (Optional, press Enter/Return for all teams): ')
+                print('\n')
+                print(leaderboard(metric, 20, int(first_week) if first_week else None, int(last_week) if last_week else None,
+                                  team_dict[team] if team else None).to_string(index=False))
+                print('\n')
+            elif int(ind_vs_mul) == 4:
                 break
             else:
                 print('Error: Invalid Input. Please re-enter your choice.')
@@ -494,228 +3586,1074 @@ def user_interface():
             print('Error: Invalid Input. Please re-enter your choice.')
 
 
-# ### Data Collection and Processing
+# ### Batch Rendering
 
-# In[13]:
+# In[74]:
 
 
-with open('api_cache.json', 'r') as json_file:
-        curr_cache = json.load(json_file)
+def init_render_worker(data_backend:str='memory', db_path:str='pl.sqlite', shared:str=None):
+    '''Loads the dataset once in a batch-rendering worker process and points the chart functions at it.
 
+    The worker gets its own context, and so its own backend (SQLite connections must not cross a fork), and its
+    own figure cache.
 
-# In[14]:
+    Parameters
+    ----------
+    data_backend (optional): string
+        'memory' to load the gameweek table (from the snapshot when available), or 'sqlite' to read from db_path.
 
+    db_path (optional): string
+        Path to the SQLite database, used by the 'sqlite' backend.
 
-df = pd.read_csv('players_1920_fin.csv')
-name_data = pd.read_csv('player_idlist.csv')
+    shared (optional): string
+        Path to a SharedDataset manifest (see publish_dataset) to map the dataset from instead of loading it.
 
+    Returns
+    -------
+    None
+    '''
+    global context, figure_cache
+    context = Context(data_backend=data_backend, db_path=db_path, rebuild_database=False, shared=shared)
+    context.require('names', 'data')
+    figure_cache = FigureCache(max_entries=16)
 
-# In[15]:
 
+# In[75]:
 
-df_vis = df.drop(['Unnamed: 0', 'kickoff_time', 'was_home', 'full', 'bps',
-                  'transfers_in', 'transfers_out', 'team_a_score', 'team_h_score'], axis=1)
 
+def render_job(job:dict, out_dir:str):
+    '''Renders one chart request to a standalone HTML or figure-JSON file.
 
-# In[16]:
+    Parameters
+    ----------
+    job: dict
+        The request: 'chart' (a chart function name), 'args' (its arguments, as a list or a dictionary),
+        and optionally 'format' ('html' or 'json', default 'html') and 'name' (the output file name, without extension).
 
+    out_dir: string
+        Directory the file is written to.
 
-new_sample_data = pd.merge(df_vis, name_data, left_on='element', right_on='id')
+    Returns
+    -------
+    dict
+        The job's name, output path, render time in seconds and error message (None on success).
+    '''
+    start = time.perf_counter()
+    name = job['name']
+    fmt = job.get('format', 'html')
+    path = os.path.join(out_dir, f'{name}.{fmt}')
+    try:
+        chart_func = chart_functions[job['chart']]
+        args = job.get('args', [])
+        fig = chart_func(*args, show=False) if isinstance(args, list) else chart_func(**args, show=False)
+        if fmt == 'json':
+            fig.write_json(path)
+        else:
+            fig.write_html(path, include_plotlyjs='cdn')
+        error = None
+    except Exception as exc:
+        path, error = None, repr(exc)
+    return({'name':name, 'path':path, 'seconds':time.perf_counter() - start, 'error':error})
 
 
-# In[17]:
+# In[76]:
 
 
-new_sample_data = new_sample_data[['id','round','first_name','second_name','team','opponent_team', 'total_points',
-                                   'minutes', 'goals_scored', 'assists', 'bonus', 'clean_sheets', 'goals_conceded',
-                                   'ict_index', 'own_goals', 'penalties_missed', 'penalties_saved','red_cards',
-                                   'saves', 'selected','transfers_balance', 'value', 'yellow_cards', 'ppm']]
+def render_batch(job_path:str, out_dir:str='charts', processes:int=None, data_backend:str='memory'):
+    '''Renders every chart request in a job file across a pool of worker processes.
 
+    The job file has one JSON request per line (see render_job). The snapshot (or database) is brought up to
+    date here first; each worker then loads the dataset from it once (or, with the 'shared' backend, maps the
+    copy this process publishes) and takes jobs in chunks. A report with
+    per-job timings is written to out_dir/report.json.
 
-# In[18]:
+    Parameters
+    ----------
+    job_path: string
+        Path to the job file.
 
+    out_dir (optional): string
+        Directory the charts and the report are written to.
 
-labels_dict = {}
-for metric in new_sample_data.columns:
-    if "_" in str(metric):
-        labels_dict.update({str(metric): str(metric).replace("_", " ").title()})
-    elif metric == "ppm":
-        labels_dict.update({str(metric): 'Points per Million'})
-    elif metric == "ict_index":
-        labels_dict.update({str(metric): 'ICT Index'})
-    else:
-        labels_dict.update({str(metric): str(metric).title()})
+    processes (optional): int
+        Number of worker processes. Defaults to the number of CPUs.
 
+    data_backend (optional): string
+        Backend each worker loads: 'memory', 'sqlite', or 'shared' (memory, mapped from shared memory).
 
-# In[19]:
+    Returns
+    -------
+    dict
+        Per-job results, the number of failures, total time in seconds and throughput in jobs/sec.
+    '''
+    with open(job_path, 'r') as job_file:
+        jobs = [json.loads(line) for line in job_file if line.strip()]
+    for i, job in enumerate(jobs):
+        job.setdefault('name', f'{i:05d}_{job["chart"]}')
+    os.makedirs(out_dir, exist_ok=True)
+    processes = processes or os.cpu_count()
+
+    start = time.perf_counter()
+    # Workers only read what is prepared here: on a fresh checkout, loading in each of them would have them all
+    # writing the snapshot (or the database) at once.
+    if data_backend == 'memory':
+        load_dataset()
+    elif data_backend == 'sqlite' and not database_ready('pl.sqlite'):
+        load_database(load_dataset()[0], 'pl.sqlite')
+    dataset = publish_dataset() if data_backend == 'shared' else None
+    initargs = ('memory', 'pl.sqlite', dataset.manifest_path) if dataset is not None else (data_backend,)
+    try:
+        # Fork lets the workers inherit the notebook's functions.
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=init_render_worker, initargs=initargs) as pool:
+            results = list(pool.map(functools.partial(render_job, out_dir=out_dir), jobs,
+                                    chunksize=max(1, len(jobs) // (processes * 4))))
+    finally:
+        if dataset is not None:
+            dataset.close()
+    seconds = time.perf_counter() - start
+
+    report = {'jobs':results, 'failed':sum(result['error'] is not None for result in results),
+              'seconds':seconds, 'jobs_per_sec':len(jobs) / seconds if seconds else 0.0}
+    with open(os.path.join(out_dir, 'report.json'), 'w') as json_file:
+        json.dump(report, json_file, indent=1)
+
+    print(f'Rendered {len(jobs) - report["failed"]}/{len(jobs)} charts in {seconds:.1f}s '
+          f'({report["jobs_per_sec"]:.1f} charts/sec, {processes} processes)')
+    return(report)
+
+
+# In[77]:
+
+
+def nightly_jobs(metric1:str='minutes', metric2:str='total_points', metric:str='total_points', fmt:str='html'):
+    '''Lists the nightly chart requests: every team's scatter_mul for every week, and line_ind for every player.
 
+    Parameters
+    ----------
+    metric1 (optional): string
+        The scatter x-axis metric.
 
-labels_dict_inv = {}
-for k in labels_dict:
-    labels_dict_inv.update({labels_dict[k]:k})
-    
-del(labels_dict_inv['Id'])
-del(labels_dict_inv['Round'])
-del(labels_dict_inv['First Name'])
-del(labels_dict_inv['Second Name'])
-del(labels_dict_inv['Team'])
-del(labels_dict_inv['Opponent Team'])
+    metric2 (optional): string
+        The scatter y-axis metric.
 
+    metric (optional): string
+        The line chart metric.
 
-# In[20]:
+    fmt (optional): string
+        Output format, 'html' or 'json'.
 
+    Returns
+    -------
+    list
+        The chart requests, ready to be written one per line to a job file.
+    '''
+    context.require('names', 'data')
+    weeks = sorted(backend.rounds)
+    jobs = [{'chart':'scatter_mul', 'args':[team, week, metric1, metric2], 'format':fmt}
+            for team in team_dict.values() for week in weeks]
+    jobs += [{'chart':'line_ind', 'args':[name, metric], 'format':fmt} for name in sorted(name_index.names.values())]
+    return(jobs)
 
-team_dict = {}
-for i in range(len(new_sample_data['team'].unique())):
-    team_dict.update({str(i+1):new_sample_data['team'].sort_values().unique()[i]})
 
+# ### HTTP Service
 
-# In[21]:
+# In[78]:
 
 
-ids = []
-for k,v in new_sample_data.groupby(by='id'):
-    ids.append(k)
+class VisualizerService:
+    '''An asyncio HTTP service exposing the visualizer's operations as JSON endpoints.
 
+    GET /<operation>?<parameter>=<value>&... runs at_a_glance (parameter: name) or any chart function
+    (parameters named as in the function; metric_list and a list of seasons are comma-separated) and returns JSON: the figure for charts,
+    the summary for at_a_glance. GET /metrics returns the recorded metrics (format=prometheus for Prometheus text). All requests share the loaded dataset and figure cache; the blocking pandas,
+    Plotly and API work runs on a thread pool so the event loop keeps accepting connections.
 
-# In[22]:
+    Parameters
+    ----------
+    host (optional): string
+        Interface to listen on.
 
+    port (optional): int
+        Port to listen on. 0 picks a free port.
 
-radar_df = pd.DataFrame({'id':ids})
+    workers (optional): int
+        Number of threads for the blocking work.
+    '''
+    def __init__(self, host:str='127.0.0.1', port:int=8050, workers:int=4):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    def operation(self, name:str, params:dict):
+        '''Runs one operation with the query parameters and returns the JSON response body.'''
+        if name == 'metrics':
+            return(metrics.to_prometheus() if params.get('format') == 'prometheus' else metrics.to_json())
+        if name == 'at_a_glance':
+            player_dict = get_player_api(params['name'])
+            if player_dict is None:
+                raise KeyError(params['name'])
+            return(json.dumps(glance_summary(player_dict, params.get('season'))))
+
+        chart_func = chart_functions[name]
+        kwargs = {}
+        for param in inspect.signature(chart_func.__wrapped__, eval_str=True).parameters.values():
+            if param.name not in params:
+                continue
+            if param.annotation is int:
+                kwargs[param.name] = int(params[param.name])
+            elif param.annotation is list or (param.name == 'season' and ',' in params[param.name]):
+                kwargs[param.name] = params[param.name].split(',')
+            else:
+                kwargs[param.name] = params[param.name]
+        return(chart_func(**kwargs, show=False).to_json())
+
+    async def handle(self, reader, writer):
+        '''Serves requests on one (keep-alive) connection.'''
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                url = urllib.parse.urlparse(target)
+                name = url.path.strip('/')
+                params = {k:v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+                if method != 'GET' or (name not in ('at_a_glance', 'metrics') and name not in chart_functions):
+                    status, body = 404, json.dumps({'error':f'Unknown operation: {name}'})
+                else:
+                    try:
+                        status, body = 200, await loop.run_in_executor(self.executor, self.operation, name, params)
+                    except (KeyError, ValueError, TypeError) as error:
+                        status, body = 400, json.dumps({'error':repr(error)})
+                    except Exception as error:
+                        status, body = 500, json.dumps({'error':repr(error)})
+
+                body = body.encode()
+                reason = {200:'OK', 400:'Bad Request', 404:'Not Found', 500:'Internal Server Error'}[status]
+                content_type = 'text/plain; version=0.0.4' if status == 200 and params.get('format') == 'prometheus' else 'application/json'
+                writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n'
+                             f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # The client went away, or the service is stopping.
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        '''Starts listening; the server's sockets are available once this returns.'''
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def start(self):
+        '''Runs the service on a background thread (so it can be used from the notebook) and returns its base URL.
+
+        The player names, API cache and dataset are loaded first, so the first requests do not all wait on the load.
+        '''
+        context.require('names', 'api', 'data')
+        started = threading.Event()
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.serve())
+            started.set()
+            self.loop.run_forever()
+            self.loop.close()
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+        return(f'http://{self.host}:{self.port}')
+
+    def stop(self):
+        '''Stops a service started with start().'''
+        async def close():
+            self.server.close()
+            connections = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in connections:
+                task.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown()
 
 
-# In[23]:
+# ### Data Collection and Processing
 
+# In[79]:
 
-radar_df['name'] = radar_df['id'].apply(lambda x: new_sample_data.query("id==@x")['first_name'].values[0]
-                                         + ' ' + new_sample_data.query("id==@x")['second_name'].values[0])
 
+# Set enabled=True to record timing spans (see metrics.to_json() / metrics.to_prometheus()).
+metrics = Metrics(enabled=False)
 
-# In[24]:
+# 'memory' serves charts from the loaded DataFrames; 'sqlite' reads them from pl.sqlite on demand
+# and releases the in-memory tables once the database is loaded.
+DATA_BACKEND = 'memory'
 
+# The dataset, API cache and database load on first use (see Context), so importing this module is cheap.
+context = Context(data_backend=DATA_BACKEND)
+
+figure_cache = FigureCache(max_entries=64)
+season_store = SeasonStore(SEASONS, max_loaded=3)
+similarity_indexes = {}
+leaderboards = {}
+team_cubes = {}
+glance_tables = {}
+metrics.gauge('figure_cache_hit_ratio', lambda: figure_cache.hit_ratio())
+metrics.gauge('api_cache_hit_ratio', lambda: api_cache.stats['hits'] / max(api_cache.stats['hits'] + api_cache.stats['misses'], 1)
+              if 'api' in context.loaded else 0.0)
+chart_functions = {'line_ind':line_ind, 'scatter_ind':scatter_ind, 'line_mul':line_mul,
+                   'bar_mul':bar_mul, 'scatter_mul':scatter_mul, 'radar_mul':radar_mul, 'radar_similar':radar_similar,
+                   'team_trend':team_trend, 'team_vs_team':team_vs_team, 'scatter_league':scatter_league,
+                   'line_players':line_players, 'bar_players':bar_players, 'radar_players':radar_players}
 
-for col in new_sample_data.columns[6:]:
-    if col in ['ict_index', 'selected','transfers_balance','value','ppm']:
-        radar_df[col] = radar_df['id'].apply(lambda x: new_sample_data.query("id==@x")[col].mean())
-    else:
-        radar_df[col] = radar_df['id'].apply(lambda x: new_sample_data.query("id==@x")[col].sum())
+
+# In[80]:
+
+
+# Run as a notebook or script, everything loads up front as before.
+if __name__ == '__main__':
+    context.require('api', 'data', 'names')
 
 
 # ### Database
 
-# In[25]:
+# In[81]:
 
 
-conn = sqlite3.connect('pl.sqlite')
-cur = conn.cursor()
+if __name__ == '__main__':
+    context.require('database')
 
-drop_table = '''
-    DROP TABLE IF EXISTS "player_data";
-'''
 
-create_table = '''
-    CREATE TABLE "player_data" (
-        id INT PRIMARY KEY NOT NULL,
-        player_id INT NOT NULL,
-        minutes INT NOT NULL,
-        goals_scored INT NOT NULL,
-        assists INT NOT NULL,
-        total_points INT NOT NULL
-);'''
+# In[82]:
 
-for command in [drop_table, create_table]:
-    cur.execute(command)
-conn.commit()
-conn.close()
 
+if __name__ == '__main__':
+    conn = sqlite3.connect('pl.sqlite')
+    cur = conn.cursor()
 
-# In[26]:
+    select_player = '''
+            SELECT n.id, first_name, last_name, SUM(total_points)
+            FROM player_data d JOIN player_name n ON n.id=d.player_id WHERE n.id=?
+            GROUP BY n.id
+        '''
 
+    cur.execute(select_player, [19])
+    print(cur.fetchall())
 
-conn = sqlite3.connect('pl.sqlite')
-cur = conn.cursor()
+    conn.commit()
+    conn.close()
 
-drop_table = '''
-    DROP TABLE IF EXISTS "player_name";
-'''
 
-create_table = '''
-    CREATE TABLE "player_name" (
-        id INT NOT NULL PRIMARY KEY UNIQUE,
-        first_name TEXT NOT NULL,
-        last_name TEXT NOT NULL
-);'''
+# ### Benchmarks and Local Testing
 
-for command in [drop_table, create_table]:
-    cur.execute(command)
-conn.commit()
-conn.close()
+# In[83]:
 
 
-# In[27]:
+def mock_player_record(player_id:int, first_name:str, second_name:str):
+    '''Builds a stand-in API record for a player, shaped like a /players response entry.
+
+    Parameters
+    ----------
+    player_id: int
+        The player's id.
 
+    first_name: string
+        The player's first name.
 
-conn = sqlite3.connect('pl.sqlite')
-cur = conn.cursor()
+    second_name: string
+        The player's second name.
 
-insert_player = '''
-        INSERT INTO player_data(id, player_id, minutes, goals_scored, assists,total_points)
-        VALUES (?,?,?,?,?,?)
+    Returns
+    -------
+    dict
+        A player record with two seasons of (zeroed) statistics.
     '''
+    season_stats = {'team':{'name':'Stand-in FC'}, 'games':{'appearences':0, 'position':'Midfielder'},
+                    'goals':{'total':0, 'assists':0, 'conceded':0, 'saves':0}, 'shots':{'total':0, 'on':0},
+                    'passes':{'accuracy':0}, 'tackles':{'total':0}, 'duels':{'total':0, 'won':0},
+                    'dribbles':{'attempts':0, 'success':0}, 'fouls':{'committed':0},
+                    'cards':{'yellow':0, 'yellowred':0, 'red':0}}
+    return({'player':{'id':player_id, 'name':f'{first_name[0]}. {second_name}', 'firstname':first_name,
+                      'lastname':second_name, 'age':0, 'nationality':''},
+            'statistics':[season_stats, season_stats]})
 
-cur.execute(insert_player, [0, 58, 90, 0, 0, 1])
-cur.execute(insert_player, [1, 19, 18, 0, 0, 1])
-cur.execute(insert_player, [2, 30, 90, 0, 0, 1])
-cur.execute(insert_player, [3, 70, 64, 0, 0, 2])
-cur.execute(insert_player, [4, 115, 14, 0, 0, 1])
 
-conn.commit()
-conn.close()
+# In[84]:
 
 
-# In[28]:
+def start_mock_api(records:list, latency:float=0.0, errors:list=None):
+    '''Starts a local stand-in for the /players endpoint on a background thread.
+
+    A GET to /players?search=<text> returns every record whose player name contains the text (case-insensitive),
+    in the same {'results': ..., 'response': [...]} shape as the real API.
+
+    Parameters
+    ----------
+    records: list
+        The player records the server answers from.
+
+    latency (optional): float
+        Seconds of delay added to every response.
+
+    errors (optional): list
+        HTTP status codes returned, in order, by the first requests before normal service starts.
+
+    Returns
+    -------
+    tuple
+        The server (call shutdown() when done) and the URL of its /players endpoint.
+    '''
+    errors = list(errors or [])
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            with lock:
+                self.server.request_count += 1
+                status = errors.pop(0) if errors else None
+            if status is not None:
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            search = query.get('search', [''])[0].lower()
+            matches = [record for record in records if search in record['player']['name'].lower()]
+            time.sleep(latency)
+            body = json.dumps({'results':len(matches), 'response':matches}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.request_count = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return(server, f'http://127.0.0.1:{server.server_address[1]}/players')
+
+
+# In[85]:
+
+
+def benchmark_api_client(requests_count:int=100, latency:float=0.0):
+    '''Compares fetch latency of one-off requests (a new connection each time) against the pooled ApiClient,
+    using the local stand-in server, and checks that concurrent fetches of one name are coalesced.
 
+    Parameters
+    ----------
+    requests_count (optional): int
+        Number of sequential fetches timed for each client.
 
-conn = sqlite3.connect('pl.sqlite')
-cur = conn.cursor()
+    latency (optional): float
+        Seconds of delay added by the stand-in server to every response.
 
-insert_player_name = '''
-        INSERT INTO player_name(id, first_name, last_name)
-        VALUES (?,?,?)
+    Returns
+    -------
+    dict
+        Mean fetch latency in ms for each client, and server requests made by 20 concurrent fetches of one name.
     '''
+    server, url = start_mock_api([mock_player_record(1, 'Stand', 'In')], latency)
+    headers = {'x-apisports-key':'benchmark'}
+    client = ApiClient(url, api_key='benchmark')
 
-cur.execute(insert_player_name, [58, 'Steven', 'Cook'])
-cur.execute(insert_player_name, [19, 'Lucas', 'Torriera'])
-cur.execute(insert_player_name, [30, 'Anwar', 'El Ghazi'])
-cur.execute(insert_player_name, [70, 'Lys', 'Mousset'])
-cur.execute(insert_player_name, [115, 'Ruben', 'Loftus-Cheek'])
+    timings = {}
+    start = time.perf_counter()
+    for _ in range(requests_count):
+        requests.request("GET", url, headers=headers, params={'league':LEAGUE_ID, 'search':'In'}).json()
+    timings['unpooled_ms'] = (time.perf_counter() - start) * 1000 / requests_count
 
-conn.commit()
-conn.close()
+    start = time.perf_counter()
+    for _ in range(requests_count):
+        client.get_json({'league':LEAGUE_ID, 'search':'In'})
+    timings['pooled_ms'] = (time.perf_counter() - start) * 1000 / requests_count
 
+    slow_server, slow_url = start_mock_api([mock_player_record(1, 'Stand', 'In')], latency=0.2)
+    slow_client = ApiClient(slow_url, api_key='benchmark')
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        list(pool.map(lambda _: fetch_player_api('Stand In', slow_client), range(20)))
+    timings['coalesced_requests'] = slow_server.request_count
 
-# In[29]:
+    server.shutdown()
+    slow_server.shutdown()
+    print(f'One-off requests: {timings["unpooled_ms"]:.2f} ms/fetch')
+    print(f'Pooled client: {timings["pooled_ms"]:.2f} ms/fetch ({timings["unpooled_ms"]/timings["pooled_ms"]:.1f}x faster)')
+    print(f'20 concurrent fetches of one player made {timings["coalesced_requests"]} request(s)')
+    return(timings)
+
+
+# In[86]:
+
+
+def benchmark_startup(repeats:int=5, snapshot_dir:str='pl_snapshot'):
+    '''Times the CSV load path against the snapshot load path and prints the best time of each.
+
+    Parameters
+    ----------
+    repeats (optional): int
+        Number of times each path is timed.
+
+    snapshot_dir (optional): string
+        Directory of the columnar snapshot (written first if missing).
+
+    Returns
+    -------
+    dict
+        Best time in seconds for each path.
+    '''
+    sources = ['players_1920_fin.csv', 'player_idlist.csv']
+    if read_snapshot(snapshot_dir, sources) is None:
+        load_dataset(snapshot_dir)
+
+    timings = {}
+    for label, loader in [('csv', lambda: load_csv_data(*sources)), ('snapshot', lambda: read_snapshot(snapshot_dir, sources))]:
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            loader()
+            runs.append(time.perf_counter() - start)
+        timings[label] = min(runs)
+
+    print(f'CSV load: {timings["csv"]*1000:.1f} ms')
+    print(f'Snapshot load: {timings["snapshot"]*1000:.1f} ms ({timings["csv"]/timings["snapshot"]:.1f}x faster)')
+    return(timings)
+
+
+# In[87]:
+
+
+IMPORT_SCENARIOS = {'import':"premier_league.notebook()",
+                    'api':"premier_league.get_player_api('Marcus Rashford')",
+                    'chart':"premier_league.line_ind('Mohamed Salah', 'ict_index', show=False)"}
+EAGER_START = ("m = premier_league.notebook(); m.context.load(); "
+               "m.np.ndarray; m.pd.DataFrame; m.requests.Session; m.px.line; m.go.Figure; m.pio.templates; ")
+
+def benchmark_imports(repeats:int=5, package_dir:str='.'):
+    '''Times a cold start of the premier_league package in a fresh interpreter, lazily and eagerly, for each use.
+
+    The uses (IMPORT_SCENARIOS) are: only importing the module, looking a player up through the API cache, and
+    building one chart. The eager start (EAGER_START) first imports every package and loads every stage, as
+    importing the notebook export used to (less the user interface).
+
+    Parameters
+    ----------
+    repeats (optional): int
+        Number of fresh interpreters timed for each use and start.
+
+    package_dir (optional): string
+        Directory holding the premier_league package. Each interpreter runs in the working directory.
+
+    Returns
+    -------
+    dict
+        Best and median wall time in ms of the lazy and eager starts for each use, and the speed-up.
+    '''
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(package_dir))
+    def measure(code):
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'import premier_league; ' + code], env=env, check=True, capture_output=True)
+            runs.append((time.perf_counter() - start) * 1000)
+        return({'best_ms':min(runs), 'median_ms':float(np.median(runs))})
+
+    timings = {}
+    for label, code in IMPORT_SCENARIOS.items():
+        timings[label] = {'lazy':measure(code), 'eager':measure(EAGER_START + code)}
+        timings[label]['speedup'] = timings[label]['eager']['median_ms'] / timings[label]['lazy']['median_ms']
+        print(f'{label}: {timings[label]["lazy"]["median_ms"]:.0f} ms lazy, {timings[label]["eager"]["median_ms"]:.0f} ms eager '
+              f'({timings[label]["speedup"]:.1f}x faster)')
+    return(timings)
+
+
+# In[88]:
+
+
+def benchmark_backends(repeats:int=200, db_path:str='pl.sqlite'):
+    '''Compares the memory held and the per-call latency of the in-memory and SQLite chart backends.
+
+    Memory is what each backend keeps allocated after it is built, as seen by tracemalloc. SQLite's own page cache
+    is allocated outside Python, so its configured limit is reported alongside.
+
+    Parameters
+    ----------
+    repeats (optional): int
+        Number of times each data-access call is timed.
+
+    db_path (optional): string
+        Path to a database written by load_database.
+
+    Returns
+    -------
+    dict
+        Memory in MB and mean latency in ms per data-access call, for each backend.
+    '''
+    context.require('names')
+    def build_memory():
+        data, radar, _, _ = load_csv_data()
+        return(MemoryBackend(*build_player_index(data), radar))
+
+    salah, mane = name_index.resolve('Mohamed Salah'), name_index.resolve('Sadio Mané')
+    calls = [('player_rows', (salah, ['round', 'total_points'])),
+             ('team_week_rows', ('Liverpool', 10, ['minutes', 'total_points', 'first_name', 'second_name'])),
+             ('season_rows', ([salah, mane], ['total_points', 'goals_scored', 'assists', 'ict_index', 'value'])),
+             ('metric_max', (['total_points', 'goals_scored', 'assists', 'ict_index', 'value'],))]
+
+    results = {}
+    for label, build in [('memory', build_memory), ('sqlite', lambda: SqliteBackend(db_path))]:
+        gc.collect()
+        tracemalloc.start()
+        test_backend = build()
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        results[label] = {'memory_mb':held / 2**20}
+        for method, args in calls:
+            getattr(test_backend, method)(*args)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                getattr(test_backend, method)(*args)
+            results[label][f'{method}_ms'] = (time.perf_counter() - start) * 1000 / repeats
+
+        if label == 'sqlite':
+            page_size = test_backend.conn.execute('PRAGMA page_size').fetchone()[0]
+            cache_size = test_backend.conn.execute('PRAGMA cache_size').fetchone()[0]
+            results[label]['page_cache_limit_mb'] = (-cache_size * 1024 if cache_size < 0 else cache_size * page_size) / 2**20
+
+    print(f'{"":16}{"memory":>10}{"sqlite":>10}')
+    for key in results['memory']:
+        print(f'{key:16}{results["memory"][key]:>10.3f}{results["sqlite"][key]:>10.3f}')
+    print(f'(plus up to {results["sqlite"]["page_cache_limit_mb"]:.1f} MB of SQLite page cache)')
+    return(results)
+
+
+# In[89]:
+
+
+SAMPLE_CHART_CALLS = [('line_ind', ('Mohamed Salah', 'ict_index')),
+                      ('scatter_ind', ('Kevin De Bruyne', 'minutes', 'value')),
+                      ('line_mul', ('Mohamed Salah', 'Sadio Mané', 'ppm')),
+                      ('bar_mul', ('Mohamed Salah', 'Sadio Mané', 'goals_scored', 'value')),
+                      ('scatter_mul', ('Liverpool', 10, 'ict_index', 'total_points')),
+                      ('radar_mul', ('Mohamed Salah', 'Sadio Mané', ['total_points', 'goals_scored', 'assists', 'ict_index', 'value']))]
+
+
+# In[90]:
+
+
+def process_memory():
+    '''Returns this process's resident (RSS), proportional (PSS) and private (USS) memory in MB (Linux only).'''
+    fields = {}
+    with open('/proc/self/smaps_rollup', 'r') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return({'rss_mb':fields['Rss'], 'pss_mb':fields['Pss'], 'uss_mb':fields['Private_Clean'] + fields['Private_Dirty']})
+
+
+# In[91]:
+
+
+def memory_probe(shared:str, ready, results):
+    '''Runs one benchmark_worker_memory worker: loads (or maps) the dataset, draws two charts, then reports its memory.'''
+    start = time.perf_counter()
+    init_render_worker('memory', shared=shared)
+    seconds = time.perf_counter() - start
+    line_ind.__wrapped__('Mohamed Salah', 'ict_index')
+    scatter_league.__wrapped__('minutes', 'total_points')
+    gc.collect()
+    ready.wait()
+    results.put(dict(process_memory(), startup_s=seconds))
+    ready.wait()
+
+
+# In[92]:
+
+
+def benchmark_worker_memory(workers:int=4):
+    '''Compares the memory of worker processes that each load the dataset privately against ones that map it from shared memory.
+
+    Each worker is forked, loads (or maps) the dataset as a batch-rendering worker does, draws two charts and
+    then reports while all of them are alive. RSS counts shared pages in every process that maps them; PSS
+    splits them between those processes; USS is memory no other process shares.
+
+    Parameters
+    ----------
+    workers (optional): int
+        Number of worker processes started for each approach.
+
+    Returns
+    -------
+    dict
+        Mean per-worker RSS, PSS and USS in MB and startup time in seconds, for 'private' and 'shared'.
+    '''
+    context.require('names', 'data')
+    dataset = publish_dataset()
+    fork = multiprocessing.get_context('fork')
+    results = {}
+    try:
+        for label, shared in [('private', None), ('shared', dataset.manifest_path)]:
+            ready, queue = fork.Barrier(workers), fork.Queue()
+            processes = [fork.Process(target=memory_probe, args=(shared, ready, queue)) for _ in range(workers)]
+            for process in processes:
+                process.start()
+            reports = [queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+            results[label] = {key:float(np.mean([report[key] for report in reports])) for key in reports[0]}
+    finally:
+        dataset.close()
+
+    for label, result in results.items():
+        print(f'{label}: RSS {result["rss_mb"]:.1f} MB, PSS {result["pss_mb"]:.1f} MB, USS {result["uss_mb"]:.1f} MB, '
+              f'startup {result["startup_s"]*1000:.0f} ms per worker ({workers} workers)')
+    return(results)
+
+
+# In[93]:
+
+
+def memory_report(gameweek_path:str='players_1920_fin.csv', names_path:str='player_idlist.csv'):
+    '''Prints the memory held by each column of the gameweek table, as loaded before and after the compact schema.
 
+    Parameters
+    ----------
+    gameweek_path (optional): string
+        Path to the gameweek-level CSV file.
+
+    names_path (optional): string
+        Path to the player id/name CSV file.
+
+    Returns
+    -------
+    DataFrame
+        Dtype and bytes per column before and after, with a total row.
+    '''
+    wide = load_csv_data(gameweek_path, names_path, compact=False)[0]
+    compact = compact_frame(wide)
+
+    report = pd.DataFrame({'dtype_before':wide.dtypes.astype(str), 'bytes_before':wide.memory_usage(index=False, deep=True),
+                           'dtype_after':compact.dtypes.astype(str), 'bytes_after':compact.memory_usage(index=False, deep=True)})
+    report.loc['total'] = ['', report['bytes_before'].sum(), '', report['bytes_after'].sum()]
+    report['saved'] = 1 - report['bytes_after'] / report['bytes_before']
+
+    print(report.to_string(formatters={'saved':'{:.0%}'.format}))
+    return(report)
+
+
+# In[94]:
+
+
+def check_compact_charts(calls:list=None):
+    '''Checks that every chart function draws the same figure from the compact table as from the full-width one.
+
+    Parameters
+    ----------
+    calls (optional): list
+        (chart function name, arguments) pairs to compare. SAMPLE_CHART_CALLS by default.
+
+    Returns
+    -------
+    dict
+        Whether the two figures were identical, for each call.
+    '''
+    global backend
+    context.require('names', 'data')
+    calls = SAMPLE_CHART_CALLS if calls is None else calls
+
+    wide, radar, _, _ = load_csv_data(compact=False)
+    backends = {'wide':MemoryBackend(*build_player_index(wide), radar),
+                'compact':MemoryBackend(*build_player_index(compact_frame(wide)), radar)}
+
+    saved_backend, results = backend, {}
+    try:
+        for chart, args in calls:
+            figures = {}
+            for label, test_backend in backends.items():
+                backend = test_backend
+                figures[label] = chart_functions[chart](*args, show=False).to_json()
+            results[f'{chart}{args}'] = figures['wide'] == figures['compact']
+    finally:
+        backend = saved_backend
+
+    for call, identical in results.items():
+        print(f'{"identical" if identical else "DIFFERENT"}  {call}')
+    return(results)
+
+
+# In[95]:
+
+
+def check_radar_df(gameweek_path:str='players_1920_fin.csv', names_path:str='player_idlist.csv'):
+    '''Checks that season_aggregates builds the same radar_df as the original per-player query/apply cells.
+
+    The original build queries the gameweek table once per player and metric, so this takes a while.
+
+    Parameters
+    ----------
+    gameweek_path (optional): string
+        Path to the gameweek-level CSV file.
 
-conn = sqlite3.connect('pl.sqlite')
-cur = conn.cursor()
+    names_path (optional): string
+        Path to the player id/name CSV file.
 
-select_player = '''
-        SELECT n.id, first_name, last_name, total_points
-        FROM player_data d JOIN player_name n ON n.id=d.player_id WHERE n.id=?
+    Returns
+    -------
+    bool
+        True. An AssertionError describing the first difference is raised if the tables differ.
+    '''
+    new_sample_data = load_csv_data(gameweek_path, names_path, compact=False)[0]
+
+    ids = []
+    for k,v in new_sample_data.groupby(by='id'):
+        ids.append(k)
+    radar_df = pd.DataFrame({'id':ids})
+    radar_df['name'] = radar_df['id'].apply(lambda x: new_sample_data.query("id==@x")['first_name'].values[0]
+                                             + ' ' + new_sample_data.query("id==@x")['second_name'].values[0])
+    for col in new_sample_data.columns[6:]:
+        if col in ['ict_index', 'selected','transfers_balance','value','ppm']:
+            radar_df[col] = radar_df['id'].apply(lambda x: new_sample_data.query("id==@x")[col].mean())
+        else:
+            radar_df[col] = radar_df['id'].apply(lambda x: new_sample_data.query("id==@x")[col].sum())
+
+    pd.testing.assert_frame_equal(season_aggregates(new_sample_data), radar_df)
+    print(f'identical  radar_df ({len(radar_df)} players, {len(radar_df.columns) - 2} metrics)')
+    return(True)
+
+
+# In[96]:
+
+
+def run_benchmarks(repeats:int=5, results_path:str='benchmark_results.json', baseline_path:str='benchmark_baseline.json',
+                   tolerance:float=0.2, update_baseline:bool=False):
+    '''Times each stage of the pipeline and records its peak memory, then compares the results against a stored baseline.
+
+    Stages: the CSV load (load_csv_data), the radar_df build (season_aggregates), building each chart's figure
+    from the data without showing it (SAMPLE_CHART_CALLS, bypassing figure_cache), get_player_api on a cache hit
+    and a cache miss against the local stand-in server, and the SQLite load and player query.
+
+    Each stage is timed repeats times; its peak memory is taken from one further run under tracemalloc, so
+    tracing does not slow the timed runs. Results are written as JSON. If there is no baseline yet (or
+    update_baseline is True) they become the baseline.
+
+    Parameters
+    ----------
+    repeats (optional): int
+        Number of timed runs of each stage.
+
+    results_path (optional): string
+        Path the results JSON is written to.
+
+    baseline_path (optional): string
+        Path of the baseline JSON to compare against.
+
+    tolerance (optional): float
+        Fraction by which a stage's best time or peak memory may exceed the baseline before it is flagged.
+
+    update_baseline (optional): boolean
+        Whether to overwrite the baseline with these results.
+
+    Returns
+    -------
+    dict
+        The results: environment details and, for each stage, best/median ms and peak MB
+        (plus the ratios to the baseline and a regression flag when there is a baseline).
     '''
+    global api_cache, api_client
+    context.require('names', 'api', 'data')
+
+    def measure(run, setup=lambda: ()):
+        times = []
+        for _ in range(repeats):
+            args = setup()
+            start = time.perf_counter()
+            run(*args)
+            times.append((time.perf_counter() - start) * 1000)
+        args = setup()
+        gc.collect()
+        tracemalloc.start()
+        run(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return({'best_ms':min(times), 'median_ms':float(np.median(times)), 'peak_mb':peak / 2**20})
+
+    stages = {}
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        stages['csv_load'] = measure(load_csv_data)
+        wide = load_csv_data(compact=False)[0]
+        stages['radar_build'] = measure(lambda: season_aggregates(wide))
+
+        for chart, args in SAMPLE_CHART_CALLS:
+            stages[f'chart.{chart}'] = measure(lambda: chart_functions[chart].__wrapped__(*args))
+
+        player_id = name_index.resolve('Mohamed Salah')
+        server, url = start_mock_api([mock_player_record(player_id, name_index.first[player_id], name_index.second[player_id])])
+        saved_cache, saved_client = api_cache, api_client
+        bench_caches = []
+
+        def fresh_cache():
+            global api_cache
+            api_cache = ApiCache(os.path.join(tmp_dir, f'api{len(bench_caches)}.sqlite'))
+            bench_caches.append(api_cache)
+            return(())
+
+        try:
+            api_client = ApiClient(url, api_key='benchmark')
+            with contextlib.redirect_stdout(io.StringIO()):
+                stages['api.cache_miss'] = measure(lambda: get_player_api('Mohamed Salah'), fresh_cache)
+                stages['api.cache_hit'] = measure(lambda: get_player_api('Mohamed Salah'))
+        finally:
+            api_cache, api_client = saved_cache, saved_client
+            server.shutdown()
+            server.server_close()
+            for cache in bench_caches:
+                cache.close()
+
+        db_path = os.path.join(tmp_dir, 'pl.sqlite')
+        def fresh_database():
+            for suffix in ['', '-wal', '-shm']:
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+            return(())
+        stages['sqlite.load'] = measure(lambda: load_database(wide, db_path), fresh_database)
+
+        def query_player():
+            conn = sqlite3.connect(db_path)
+            conn.execute('''
+                SELECT n.id, first_name, last_name, SUM(total_points)
+                FROM player_data d JOIN player_name n ON n.id=d.player_id WHERE n.id=?
+                GROUP BY n.id''', [player_id]).fetchall()
+            conn.close()
+        stages['sqlite.query'] = measure(query_player)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    results = {'environment':{'python':platform.python_version(), 'pandas':pd.__version__, 'numpy':np.__version__,
+                              'machine':platform.machine(), 'repeats':repeats, 'timestamp':time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'stages':stages}
+
+    baseline = None
+    if os.path.exists(baseline_path) and not update_baseline:
+        with open(baseline_path, 'r') as json_file:
+            baseline = json.load(json_file)['stages']
+
+    print(f'{"stage":24}{"best ms":>10}{"peak MB":>10}{"vs base":>10}')
+    for stage, result in stages.items():
+        line = f'{stage:24}{result["best_ms"]:>10.2f}{result["peak_mb"]:>10.2f}'
+        if baseline is not None and stage in baseline:
+            result['time_ratio'] = result['best_ms'] / baseline[stage]['best_ms']
+            result['memory_ratio'] = result['peak_mb'] / baseline[stage]['peak_mb'] if baseline[stage]['peak_mb'] else 1.0
+            result['regression'] = result['time_ratio'] > 1 + tolerance or result['memory_ratio'] > 1 + tolerance
+            line += f'{result["time_ratio"]:>9.2f}x' + ('  REGRESSION' if result['regression'] else '')
+        print(line)
+
+    with open(results_path, 'w') as json_file:
+        json.dump(results, json_file, indent=2)
+    if baseline is None:
+        with open(baseline_path, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f'Baseline written to {baseline_path}')
+    return(results)
+
+
+# In[97]:
+
+
+def load_test(base_url:str, paths:list, concurrency:int=16, total_requests:int=500):
+    '''Drives a running VisualizerService with concurrent keep-alive clients and reports latency and throughput.
+
+    Parameters
+    ----------
+    base_url: string
+        Base URL of the service, as returned by VisualizerService.start().
+
+    paths: list
+        Request paths (with query strings), cycled through by the clients.
 
-cur.execute(select_player, [19])
-print(cur.fetchall())
+    concurrency (optional): int
+        Number of concurrent client connections.
 
-conn.commit()
-conn.close()
+    total_requests (optional): int
+        Total number of requests sent.
+
+    Returns
+    -------
+    dict
+        p50/p99/max latency in ms, requests/sec and the count of non-200 responses.
+    '''
+    url = urllib.parse.urlparse(base_url)
+    latencies, errors = [], []
+    counter = iter(range(total_requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(url.hostname, url.port)
+        for i in counter:
+            path = paths[i % len(paths)]
+            start = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\n\r\n'.encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+        writer.close()
+
+    async def run():
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(asyncio.run, run()).result()
+    seconds = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    results = {'p50_ms':float(np.percentile(latencies, 50)), 'p99_ms':float(np.percentile(latencies, 99)),
+               'max_ms':float(latencies.max()), 'requests_per_sec':len(latencies) / seconds, 'errors':len(errors)}
+    print(f'{len(latencies)} requests, concurrency {concurrency}: p50 {results["p50_ms"]:.1f} ms, '
+          f'p99 {results["p99_ms"]:.1f} ms, {results["requests_per_sec"]:.0f} req/s, {results["errors"]} errors')
+    return(results)
 
 
 # ### User Interaction and Visualization
 
-# In[30]:
+# In[98]:
 
 
-user_interface()
+if __name__ == '__main__':
+    user_interface()
 
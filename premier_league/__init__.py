@@ -0,0 +1,42 @@
+'''Importable interface to the SI 507 Premier League 2019-20 visualizer.
+
+The notebook export is imported as premier_league.notebook the first time one of its names is used. Its heavy
+packages (pandas, plotly, requests) and its data load later still, only when a function needs them (see
+Context in the notebook), e.g.
+
+    import premier_league
+    premier_league.at_a_glance(premier_league.get_player_api('Mohamed Salah'))   # player names and API cache only
+    premier_league.line_ind('Mohamed Salah', 'ict_index')                         # loads the dataset
+    premier_league.context.radar_df                                               # loads the dataset
+
+Data files, caches and pl.sqlite are read relative to the working directory, as in the notebook.
+'''
+import importlib.util
+import os
+import sys
+
+NOTEBOOK_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'SI 507 Final Project - Premier League 2019-20 Data.py')
+
+
+def notebook():
+    '''Returns the notebook export as a module, importing it on first use.'''
+    name = __name__ + '.notebook'
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, NOTEBOOK_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+    return(module)
+
+
+def __getattr__(name:str):
+    module = notebook()
+    if name in module.Context.GLOBALS:
+        return(getattr(module.context, name))
+    return(getattr(module, name))